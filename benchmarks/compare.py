@@ -0,0 +1,96 @@
+"""
+Compares two benchmark result files.
+
+    python benchmarks/compare.py out/benchmarks/<old>.json out/benchmarks/<new>.json
+
+Exits with status 1 if a benchmark got slower than `--threshold` (relative
+change of the median).
+"""
+
+import argparse
+import json
+import sys
+
+from rich.console import Console
+from rich.table import Table
+
+
+def _key(result: dict) -> tuple:
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def _params(result: dict) -> str:
+    return ", ".join(f"{k}={v}" for k, v in result["params"].items())
+
+
+def print_results(results: list[dict]) -> None:
+    table = Table("Benchmark", "Parameters", "Min [ms]", "Median [ms]")
+    for result in results:
+        table.add_row(
+            result["name"],
+            _params(result),
+            f"{result['min'] * 1e3:.2f}",
+            f"{result['median'] * 1e3:.2f}",
+        )
+    Console().print(table)
+
+
+def compare(base: dict, new: dict, threshold: float = 0.1) -> list[dict]:
+    """
+    Prints the change of the median of every benchmark in both runs.
+
+    Returns:
+        list[dict]: Results of `new` that are slower than `threshold`.
+    """
+    base_results = {_key(r): r for r in base["results"]}
+    table = Table(
+        "Benchmark",
+        "Parameters",
+        f"{base['revision']} [ms]",
+        f"{new['revision']} [ms]",
+        "Change",
+        title=f"{base['revision']} -> {new['revision']}",
+    )
+
+    regressions = []
+    for result in new["results"]:
+        old = base_results.get(_key(result))
+        if old is None:
+            continue
+
+        change = result["median"] / old["median"] - 1
+        style = "red" if change > threshold else "green" if change < -threshold else ""
+        if change > threshold:
+            regressions.append(result)
+        table.add_row(
+            result["name"],
+            _params(result),
+            f"{old['median'] * 1e3:.2f}",
+            f"{result['median'] * 1e3:.2f}",
+            f"[{style}]{change:+.1%}[/{style}]" if style else f"{change:+.1%}",
+        )
+
+    Console().print(table)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compares two benchmark runs.")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    regressions = compare(base, new, threshold=args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Price series for the benchmarks.
+
+Synthetic series are generated from a fixed seed. Recorded series are real
+histories saved with `python benchmarks/run.py --record TICKER ...` while
+online, and are used by the benchmarks in addition to the synthetic ones.
+
+No recorded fixtures are committed: real histories are not redistributed
+with the repository. A fresh checkout therefore benchmarks the synthetic
+series only, and results of machines with different recorded fixtures are
+only comparable on the series both have.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.data import COLUMNS, PriceStore
+
+RECORDED_PATH = Path(__file__).parent / "fixtures"
+
+
+def synthetic_history(n_days: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Daily bars in the layout of the price store: a random walk with fat tails
+    ending today and a quarterly dividend of about 0.5% of the price.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_days)
+
+    returns = 0.0003 + 0.012 * rng.standard_t(df=4, size=n_days) / np.sqrt(2)
+    close = 100 * np.exp(np.cumsum(np.log1p(returns)))
+    dividends = np.where(np.arange(n_days) % 63 == 62, 0.005 * close, 0.0)
+    # dividends paid after a date lower its adjusted close
+    adj_ratio = np.cumprod((1 - dividends / close)[::-1])[::-1]
+    adj_ratio = np.append(adj_ratio[1:], 1.0)
+
+    data = pd.DataFrame(
+        {
+            "Open": close,
+            "High": close * 1.005,
+            "Low": close * 0.995,
+            "Close": close,
+            "Adj Close": close * adj_ratio,
+            "Volume": 1e6,
+            "Dividends": dividends,
+            "Stock Splits": 0.0,
+        },
+        index=index.rename("Date"),
+    )
+    return data[COLUMNS]
+
+
+def recorded_histories() -> dict[str, pd.DataFrame]:
+    """
+    Recorded fixtures by ticker, empty until `record` has been run (none are
+    committed, see the module docstring).
+    """
+    return {
+        file.stem: pd.read_parquet(file)
+        for file in sorted(RECORDED_PATH.glob("*.parquet"))
+    }
+
+
+def record(tickers: list[str]) -> None:
+    """
+    Saves the full history of `tickers` as fixtures, from the local price
+    store if it is fresh and downloaded otherwise (so run it online).
+    """
+    from utils.data import get_histories
+
+    RECORDED_PATH.mkdir(exist_ok=True)
+    for ticker, data in get_histories(tickers, auto_adjust=False).items():
+        data.to_parquet(RECORDED_PATH / f"{ticker}.parquet")
+
+
+def build_store(path: Path, n_tickers: int, n_days: int) -> list[str]:
+    """
+    Fills a price store with synthetic tickers (fresh, so nothing is
+    downloaded) and returns their symbols.
+    """
+    store = PriceStore(path)
+    tickers = [f"SYN{i}_{n_days}" for i in range(n_tickers)]
+    for i, ticker in enumerate(tickers):
+        store.put(ticker, synthetic_history(n_days, seed=i))
+    return tickers
@@ -0,0 +1,294 @@
+"""
+Offline benchmarks of the simulation, backtest, dividend and portfolio hot paths.
+
+    python benchmarks/run.py                  # full grid
+    python benchmarks/run.py --quick          # first value of every parameter
+    python benchmarks/run.py --filter bands   # only matching benchmarks
+    python benchmarks/run.py --record NVDA    # save recorded fixtures (online)
+
+Everything runs in a temporary directory with a synthetic price store, so no
+data is downloaded. No recorded fixtures are committed, so the series are
+the synthetic ones plus whatever was recorded on this machine. Results are
+written to `out/benchmarks/<commit>.json`; compare two runs with
+`benchmarks/compare.py`.
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import product
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fixtures import build_store, record, recorded_histories, synthetic_history
+
+REPO = Path(__file__).resolve().parent.parent
+DTE = 30
+P_ITM = 0.3
+SYNTHETIC_SERIES = {"syn500": 500, "syn2500": 2500, "syn5000": 5000}
+
+BENCHMARKS = {}
+
+
+def benchmark(**grid: list):
+    """Registers a setup function, which is run for every combination of `grid`
+    and returns the callable to time."""
+
+    def register(setup: Callable[..., Callable[[], object]]):
+        BENCHMARKS[setup.__name__] = (setup, grid)
+        return setup
+
+    return register
+
+
+def load_series(name: str) -> pd.DataFrame:
+    if name in SYNTHETIC_SERIES:
+        return synthetic_history(SYNTHETIC_SERIES[name])
+    return recorded_histories()[name]
+
+
+def daily_returns(series: str) -> np.ndarray:
+    return load_series(series)["Close"].pct_change().dropna().to_numpy()
+
+
+_stores = {}
+
+
+def synthetic_tickers(n_tickers: int, n_days: int) -> list[str]:
+    """Tickers of a synthetic store in the working directory (built once)."""
+    from utils.data import STORE_PATH
+
+    key = (n_tickers, n_days)
+    if key not in _stores:
+        _stores[key] = build_store(STORE_PATH, n_tickers, n_days)
+    return _stores[key]
+
+
+# %% benchmarks
+
+SERIES = [*SYNTHETIC_SERIES, *recorded_histories()]
+
+
+@benchmark(
+    series=SERIES,
+    engine=["bootstrap", "streaming", "parallel"],
+    n_samples=[10_000, 100_000],
+)
+def bands_monte_carlo(series: str, engine: str, n_samples: int):
+    from options.simulation import expected_move_bands
+
+    returns = daily_returns(series)
+    return lambda: expected_move_bands(
+        returns, DTE, P_ITM, engine=engine, n_samples=n_samples, seed=0
+    )
+
+
+@benchmark(series=SERIES)
+def bands_fft(series: str):
+    from options.simulation import expected_move_bands
+
+    returns = daily_returns(series)
+    return lambda: expected_move_bands(returns, DTE, P_ITM, engine="fft")
+
+
+@benchmark(
+    series=["syn500", "syn2500"],
+    n_samples=[500, 2_500],
+    weighting=["uniform", "exponential", "regime"],
+)
+def backtest_batched(series: str, n_samples: int, weighting: str):
+    from options.reliability import simulate_cutoffs
+
+    close = load_series(series)["Close"]
+    returns = close.pct_change().fillna(0).to_numpy()
+    cutoffs = np.arange(len(returns) // 5, len(returns) - DTE)
+    return lambda: simulate_cutoffs(
+        returns,
+        close.to_numpy(),
+        cutoffs,
+        DTE,
+        P_ITM,
+        n_samples=n_samples,
+        seed=0,
+        weighting=weighting,
+    )
+
+
+@benchmark(series=["syn500", "syn2500"], n_samples=[2_500], n_cutoffs=[20])
+def backtest_per_cutoff(series: str, n_samples: int, n_cutoffs: int):
+    from options.reliability import simulate
+
+    close = load_series(series)["Close"]
+    returns = close.pct_change().fillna(0).to_numpy()
+    cutoffs = np.linspace(len(returns) // 5, len(returns) - DTE - 1, n_cutoffs)
+
+    def run():
+        for cutoff in cutoffs.astype(int):
+            simulate(returns, close.to_numpy(), cutoff, DTE, P_ITM, n_samples, seed=0)
+
+    return run
+
+
+@benchmark(n_tickers=[10, 50], n_days=[1_250])
+def strategy_backtest(n_tickers: int, n_days: int):
+    from options.strategy import simulate_trades
+
+    closes = {
+        f"SYN{i}": synthetic_history(n_days, seed=i)["Close"] for i in range(n_tickers)
+    }
+    return lambda: simulate_trades(closes, DTE, P_ITM, n_samples=500, seed=0)
+
+
+@benchmark(n_years=[5, 20], n_tickers=[100, 1_000])
+def dividend_table(n_years: int, n_tickers: int):
+    income = importlib.import_module("passive-income.income")
+
+    holdings = {
+        "stocks": {
+            "ibkr": [{"ticker": f"SYN{i}", "position": 10} for i in range(n_tickers)]
+        }
+    }
+    dividends = {
+        f"SYN{i}": synthetic_history(252 * n_years, seed=i)["Dividends"].loc[
+            lambda d: d > 0
+        ]
+        for i in range(n_tickers)
+    }
+    return lambda: income.dividend_table(
+        income.holdings_frame(holdings, ["ibkr"]), income.dividend_frame(dividends), {}
+    )
+
+
+@benchmark(n_tickers=[5, 50, 500], n_days=[2_500])
+def yoy_returns(n_tickers: int, n_days: int):
+    from portfolio.analytics import calendar_year_returns
+    from portfolio.relative_performance import load_returns
+
+    tickers = synthetic_tickers(n_tickers, n_days)
+    return lambda: calendar_year_returns(load_returns(tickers, "max")).collect()
+
+
+@benchmark(n_tickers=[5, 50], n_days=[2_500, 5_000])
+def portfolio_ingestion(n_tickers: int, n_days: int):
+    from etfs.portfolio import Portfolio
+
+    tickers = synthetic_tickers(n_tickers, n_days)
+    return lambda: Portfolio(tickers).common_data().collect()
+
+
+# %% runner
+
+
+def measure(func: Callable[[], object], repeats: int) -> list[float]:
+    """Wall times of `repeats` calls after one warm-up call."""
+    func()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def git_revision() -> str:
+    def git(*args):
+        return subprocess.run(
+            ["git", *args], cwd=REPO, capture_output=True, text=True
+        ).stdout.strip()
+
+    revision = git("rev-parse", "--short", "HEAD") or "unknown"
+    return revision + (
+        "-dirty" if git("status", "--porcelain", "--untracked-files=no") else ""
+    )
+
+
+def run(quick: bool, filters: list[str], repeats: int) -> list[dict]:
+    from rich.progress import track
+
+    cases = [
+        (name, dict(zip(grid, values)))
+        for name, (_, grid) in BENCHMARKS.items()
+        if not filters or any(f in name for f in filters)
+        for values in product(*([v[:1] if quick else v for v in grid.values()]))
+    ]
+
+    results = []
+    for name, params in track(cases, description="Benchmarking..."):
+        func = BENCHMARKS[name][0](**params)
+        times = measure(func, repeats)
+        results.append(
+            {
+                "name": name,
+                "params": params,
+                "min": min(times),
+                "median": statistics.median(times),
+                "repeats": repeats,
+            }
+        )
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--filter", nargs="+", default=[])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="default: out/benchmarks/<commit>.json")
+    parser.add_argument("--record", nargs="+", metavar="TICKER")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record(args.record)
+        return
+
+    revision = git_revision()
+    output = Path(args.output or REPO / "out" / "benchmarks" / f"{revision}.json")
+    output = output.resolve()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)  # the price store lives in ./out/cache
+        try:
+            results = run(args.quick, args.filter, args.repeats)
+        finally:
+            os.chdir(cwd)
+
+    import polars as pl
+
+    report = {
+        "revision": revision,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": {
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "polars": pl.__version__,
+        },
+        "quick": args.quick,
+        "results": results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    from compare import print_results
+
+    print_results(results)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
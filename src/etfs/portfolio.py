@@ -1,57 +1,64 @@
 # %%
-import seaborn as sns
-from matplotlib import pyplot as plt
-import yfinance as yf
 import polars as pl
 
+from utils.data import scan_prices
+
+DEFAULT_TICKERS = [
+    # "JEPQ",
+    "DIVO",
+    "DGRO",
+    "SCHD",
+]
+
 
 # %%
 class Portfolio:
     def __init__(self, tickers: list[str]) -> None:
-        self.tickers = tickers
-        _yf_data = yf.Tickers(tickers).history(
-            period="max", interval="1d", group_by="ticker"
-        )
-
-        # init data
-        self.data = {
-            tick: pl.from_pandas(_yf_data[tick], include_index=True)
-            for tick in self.tickers
-        }
-        self.data = {
-            tick: data.rename(
-                {c: c.lower().replace(" ", "_") for c in data.columns}
-            ).sort("date")
-            for tick, data in self.data.items()
-        }
+        # long format, one row per date and ticker
+        self.data = scan_prices(tickers).select("date", "ticker", "close", "dividends")
 
         # calc min common date
-        self.min_common_date = max(
-            [data.drop_nulls("close")["date"].min() for data in self.data.values()]
-        ).date()
+        first_dates = self.data.group_by("ticker").agg(pl.col("date").min()).collect()
+        available = set(first_dates["ticker"].cast(pl.String))
+        self.tickers = [tick for tick in tickers if tick in available]
+        self.min_common_date = first_dates["date"].max()
+
+    def common_data(self) -> pl.LazyFrame:
+        """Rows from the first date on which every ticker has a price."""
+        return self.data.filter(pl.col("date") >= self.min_common_date).sort(
+            "ticker", "date"
+        )
 
     def plot_history(self, reinvest_dividends: bool = False):
+        import seaborn as sns
+        from matplotlib import pyplot as plt
+
         fig, ax = plt.subplots(figsize=(12, 6))
         palette = sns.color_palette("husl", len(self.tickers))
 
-        for idx, (tick, data) in enumerate(self.data.items()):
-            _data_filtered = data.filter(pl.col("date") >= self.min_common_date)
-
-            if reinvest_dividends:
-                _data_filtered = _data_filtered.with_columns(
-                    pl.col("close") + pl.col("dividends").cum_sum()
-                )
-
-            sns.lineplot(
-                data=_data_filtered.with_columns(
-                    close_normalized=pl.col("close") / pl.col("close").first()
-                ),
-                x="date",
-                y="close_normalized",
-                ax=ax,
-                label=tick,
-                color=palette[idx],
+        close = pl.col("close")
+        if reinvest_dividends:
+            close = close + pl.col("dividends").cum_sum().over("ticker")
+
+        history = (
+            self.common_data()
+            .with_columns(close=close)
+            .with_columns(
+                close_normalized=pl.col("close")
+                / pl.col("close").first().over("ticker")
             )
+            .collect()
+        )
+
+        sns.lineplot(
+            data=history.to_pandas(),
+            x="date",
+            y="close_normalized",
+            hue="ticker",
+            hue_order=self.tickers,
+            palette=palette,
+            ax=ax,
+        )
 
         ax.legend()
         ax.set_title(
@@ -60,16 +67,18 @@ class Portfolio:
         sns.despine()
 
     def plot_correlation(self):
-        common_data = pl.DataFrame(
-            {
-                tick: data.filter(pl.col("date") >= self.min_common_date)["close"]
-                for tick, data in self.data.items()
-            }
-        )
+        import seaborn as sns
 
-        correlation_matrix = (
-            common_data.with_columns(pl.all().pct_change()).drop_nulls().corr()
+        returns = (
+            self.common_data()
+            .with_columns(pl.col("close").pct_change().over("ticker"))
+            .collect()
+            .pivot(on="ticker", index="date", values="close")
+            .select(self.tickers)
+            .drop_nulls()
         )
+
+        correlation_matrix = returns.corr().to_pandas().set_axis(self.tickers)
         sns.heatmap(
             correlation_matrix,
             annot=True,
@@ -80,13 +89,24 @@ class Portfolio:
         )
 
 
-portfolio = Portfolio(
-    [
-        # "JEPQ",
-        "DIVO",
-        "DGRO",
-        "SCHD",
-    ]
-)
-portfolio.plot_history(reinvest_dividends=False)
-portfolio.plot_correlation()
+def main(
+    tickers: list[str] | None = None,
+    reinvest_dividends: bool = False,
+    output_dir: str = "out",
+) -> None:
+    from matplotlib import pyplot as plt
+
+    portfolio = Portfolio(tickers or DEFAULT_TICKERS)
+
+    portfolio.plot_history(reinvest_dividends=reinvest_dividends)
+    plt.savefig(f"{output_dir}/etf_history.png", dpi=300, bbox_inches="tight")
+    plt.close()
+
+    plt.figure()
+    portfolio.plot_correlation()
+    plt.savefig(f"{output_dir}/etf_correlation.png", dpi=300, bbox_inches="tight")
+    plt.close()
+
+
+if __name__ == "__main__":
+    main()
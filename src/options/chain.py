@@ -0,0 +1,199 @@
+"""
+Expected-move strikes for every listed option expiration of a ticker.
+
+Expirations and implied volatilities come from a local snapshot of the option
+chain (`pft expiries --snapshot` saves one while online), so the strikes are
+computed offline. One simulation up to the farthest expiration gives the
+bands of every expiration and delta level.
+"""
+
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from options.expected_move import sampling_weights
+from options.simulation import horizon_quantiles
+from utils import trace
+from utils.concurrency import get_rate_limiter, retry
+from utils.config import load_config
+from utils.data import YAHOO_HOST, get_history
+from utils.log import log
+
+CHAIN_PATH = Path("out/cache/chains")
+TRADING_DAYS = 252
+
+
+def snapshot_path(ticker: str) -> Path:
+    return CHAIN_PATH / f"{ticker}.parquet"
+
+
+def save_snapshot(ticker: str) -> pd.DataFrame:
+    """
+    Downloads the option chain of `ticker` and stores it as its snapshot.
+
+    Returns:
+        pd.DataFrame: `as_of`, `expiration`, `type` ("call"/"put"), `strike`
+            and `implied_volatility`, one row per contract.
+    """
+    import yfinance as yf
+
+    rate_limiter = get_rate_limiter(YAHOO_HOST)
+    option_ticker = yf.Ticker(ticker)
+    expirations = retry(lambda: option_ticker.options, rate_limiter=rate_limiter)
+
+    frames = []
+    for expiration in expirations:
+        chain = retry(
+            lambda: option_ticker.option_chain(expiration), rate_limiter=rate_limiter
+        )
+        for kind, quotes in (("call", chain.calls), ("put", chain.puts)):
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "expiration": pd.Timestamp(expiration),
+                        "type": kind,
+                        "strike": quotes["strike"].to_numpy(),
+                        "implied_volatility": quotes["impliedVolatility"].to_numpy(),
+                    }
+                )
+            )
+    if not frames:
+        raise ValueError(f"No listed options for {ticker}")
+
+    snapshot = pd.concat(frames, ignore_index=True)
+    snapshot.insert(0, "as_of", pd.Timestamp.today().normalize())
+
+    path = snapshot_path(ticker)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot.to_parquet(path, index=False)
+    log.info(f"Saved {len(expirations)} expirations of {ticker} to {path}")
+    return snapshot
+
+
+def load_snapshot(ticker: str) -> pd.DataFrame:
+    """Stored chain snapshot of `ticker` (see `save_snapshot`)."""
+    path = snapshot_path(ticker)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"No option chain snapshot for {ticker} at {path}, "
+            f"save one with `pft expiries --ticker {ticker} --snapshot`"
+        )
+    return pd.read_parquet(path)
+
+
+def atm_volatility(snapshot: pd.DataFrame, spot: float) -> pd.Series:
+    """
+    Implied volatility per expiration at the strike closest to `spot`
+    (mean of the call and the put), ignoring quotes without a volatility.
+    """
+    quotes = snapshot[snapshot["implied_volatility"] > 1e-3]
+    distance = (quotes["strike"] - spot).abs()
+    nearest = distance == distance.groupby(quotes["expiration"]).transform("min")
+    return quotes[nearest].groupby("expiration")["implied_volatility"].mean()
+
+
+def expiry_bands(
+    yft: pd.DataFrame,
+    snapshot: pd.DataFrame,
+    p_itms: list[float],
+    n_samples: int = 100_000,
+    seed: int | None = None,
+    sampler: str = "plain",
+    config: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Expected-move strikes for every expiration in `snapshot` after the last
+    close of `yft` and every level in `p_itms`, next to the moves implied by
+    the at-the-money volatility of the snapshot.
+
+    Horizons are business days from the last close to the expiration
+    (`np.busday_count`, exchange holidays are not excluded). The implied
+    moves assume a driftless lognormal price with the ATM volatility.
+    The returns are weighted by `WEIGHTING` of `config`, if given.
+
+    Returns:
+        pd.DataFrame: One row per expiration and P_ITM with the horizon
+            (`dte`), bootstrapped `lower_strike`/`upper_strike` and the
+            implied `iv`, `iv_lower_strike` and `iv_upper_strike`.
+    """
+    last_date, spot = yft.index[-1], yft["Close"].iloc[-1]
+    expirations = pd.DatetimeIndex(np.sort(snapshot["expiration"].unique()))
+    expirations = expirations[expirations > last_date]
+    if len(expirations) == 0:
+        raise ValueError("All expirations of the snapshot lie in the past")
+
+    horizons = np.busday_count(
+        last_date.date(), expirations.values.astype("datetime64[D]")
+    )
+    horizons = np.maximum(horizons, 1)
+
+    p_itms = np.asarray(p_itms, dtype=np.float64)
+    returns = yft["Close"].pct_change().dropna().to_numpy()
+    with trace.span("simulate", horizons=len(horizons), n_samples=n_samples):
+        quantiles = horizon_quantiles(
+            returns,
+            horizons,
+            np.concatenate([p_itms, 1 - p_itms]),
+            n_samples=n_samples,
+            seed=seed,
+            sampler=sampler,
+            weights=None if config is None else sampling_weights(returns, config),
+        )
+    lower, upper = quantiles[: len(p_itms)], quantiles[len(p_itms) :]
+
+    # (p_itms, expirations) moves of a lognormal price with the ATM volatility
+    iv = atm_volatility(snapshot, spot).reindex(expirations).to_numpy()
+    scale = iv * np.sqrt(horizons / TRADING_DAYS)
+    z = np.array([NormalDist().inv_cdf(p) for p in p_itms])[:, None]
+    drift = -0.5 * scale**2
+
+    table = pd.MultiIndex.from_product(
+        [expirations, p_itms], names=["expiration", "p_itm"]
+    ).to_frame(index=False)
+    table.insert(1, "dte", np.repeat(horizons, len(p_itms)))
+    table["lower_strike"] = spot * (1 + lower.T.ravel())
+    table["upper_strike"] = spot * (1 + upper.T.ravel())
+    table["iv"] = np.repeat(iv, len(p_itms))
+    table["iv_lower_strike"] = (spot * np.exp(drift + z * scale)).T.ravel()
+    table["iv_upper_strike"] = (spot * np.exp(drift - z * scale)).T.ravel()
+    return table
+
+
+def main(
+    config_path: str = "config/shortput.toml",
+    snapshot: bool = False,
+    output_dir: str = "out/chain",
+    **overrides,
+) -> None:
+    """
+    Writes the strikes of every expiration of `TICKER` and level in
+    `CHAIN_P_ITMS` to `<output_dir>/<ticker>.csv/.parquet`. With `snapshot`,
+    the option chain is downloaded and stored first.
+    """
+    config = load_config(config_path, **overrides)
+    ticker = config.get("TICKER")
+
+    chain = save_snapshot(ticker) if snapshot else load_snapshot(ticker)
+    yft = get_history(ticker, config.get("PERIOD"))
+    table = expiry_bands(
+        yft,
+        chain,
+        p_itms=config.get("CHAIN_P_ITMS", [config.get("P_ITM")]),
+        n_samples=config.get("N_SAMPLES", 100_000),
+        seed=config.get("SEED"),
+        sampler=config.get("SAMPLER", "plain"),
+        config=config,
+    )
+
+    output = Path(output_dir) / ticker
+    output.parent.mkdir(parents=True, exist_ok=True)
+    table.to_parquet(output.with_suffix(".parquet"), index=False)
+    table.to_csv(output.with_suffix(".csv"), index=False)
+    print(table.to_string(index=False, float_format="{:.2f}".format))
+    log.info(f"Wrote {len(table)} rows to {output}.parquet/.csv")
+
+
+if __name__ == "__main__":
+    main()
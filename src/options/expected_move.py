@@ -1,122 +1,181 @@
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mtick
 import numpy as np
-import seaborn as sns
-import toml
-import yfinance as yf
+import pandas as pd
 
-# plt.rcParams["font.family"] = "Arial"
-plt.rcParams["font.size"] = 10
+from options.simulation import cross_check, expected_move_bands, return_weights
+from utils import trace
+from utils.config import load_config
+from utils.data import get_history
 
-config = toml.load("config/shortput.toml")
-TICKER = config.get("TICKER")
-DTE = config.get("DTE")
-P_ITM = config.get("P_ITM")  # 0.3
-PERIOD = config.get("PERIOD")  # "5y"
-
-yft = yf.Ticker(TICKER).history(PERIOD)
-returns = yft["Close"].pct_change().dropna().values
-
-samples = np.random.choice(returns, (100_000, DTE)) + 1
-final_return = samples.cumprod(axis=1) - 1
-
-lower_bound = np.quantile(final_return, P_ITM, axis=0)
-upper_bound = np.quantile(final_return, 1 - P_ITM, axis=0)
+N_DAYSTOPLOT = 365
 
 
-N_DAYSTOPLOT = 365
-if N_DAYSTOPLOT > len(yft):
-    raise IndexError("Cannot plot more days than `PERIOD`")
-yft_plot = yft[-N_DAYSTOPLOT:]
-
-# sns.set_context('talk')
-fig, ax = plt.subplots(figsize=(9, 5))
-sns.lineplot(
-    x=yft_plot.index[-N_DAYSTOPLOT:], y=yft_plot.Close[-N_DAYSTOPLOT:], ax=ax, color="k"
-)
-x_extrapolation = yft_plot.index.max() + np.array(
-    [np.timedelta64(i, "D") for i in range(DTE)]
-)
-
-ax.fill_between(
-    yft_plot.index,
-    yft_plot.Close,
-    0.98 * yft_plot.Close.min(),
-    color="0.9",
-    # hatch='///',
-    linewidth=0,
-    edgecolor="0.5",
-)
-
-sns.despine()
-
-fmt = "${x:,.0f}"
-tick = mtick.StrMethodFormatter(fmt)
-ax.yaxis.set_major_formatter(tick)
-
-monthyearFmt = mdates.DateFormatter("%b %y")
-ax.xaxis.set_major_formatter(monthyearFmt)
-
-ax.plot(x_extrapolation, (lower_bound + 1) * yft_plot.Close.iloc[-1], color="red")
-ax.plot(x_extrapolation, (upper_bound + 1) * yft_plot.Close.iloc[-1], color="green")
-
-ax.fill_between(
-    x_extrapolation,
-    (lower_bound + 1) * yft_plot.Close.iloc[-1],
-    (upper_bound + 1) * yft_plot.Close.iloc[-1],
-    color="white",  # '0.8',
-    hatch="///",
-    linewidth=0,
-    edgecolor="0.5",
-)
-
-
-lower_final_price = (lower_bound[-1] + 1) * yft_plot.Close.iloc[-1]
-upper_final_price = (upper_bound[-1] + 1) * yft_plot.Close.iloc[-1]
-
-
-# ax.set_title(
-#     f"\${TICKER} (${yft_plot.Close.iloc[-1]:.2f}) Expected Delta = {P_ITM} Move of {DTE} DTE based on prev {PERIOD}",
-#     size=16,
-# )
-
-ax.set_title(f"[\${lower_final_price:.2f}, \${upper_final_price:.2f}]")
-
-ax.set(
-    xlim=(yft_plot.index.min(), x_extrapolation[-1] + np.timedelta64(2, "D")),
-    ylim=(
-        yft_plot.Close.min() * 0.98,
-        1.02
-        * max(
-            yft_plot.Close.max(), ((upper_bound + 1) * yft_plot.Close.iloc[-1]).max()
+def sampling_weights(returns: np.ndarray, config: dict) -> np.ndarray | None:
+    """Sampling weight per return from `WEIGHTING` and `HALFLIFE` (None if uniform)."""
+    return return_weights(
+        np.log1p(returns),
+        config.get("WEIGHTING", "uniform"),  # uniform, exponential, regime
+        halflife=config.get("HALFLIFE", 250),
+    )
+
+
+def compute_bands(yft: pd.DataFrame, config: dict) -> tuple[np.ndarray, np.ndarray]:
+    """Expected-move bands (as simple returns) for every day up to `DTE`."""
+    with trace.span("returns"):
+        returns = yft["Close"].pct_change().dropna().values
+    dte, p_itm = config.get("DTE"), config.get("P_ITM")
+    engine = config.get("ENGINE", "bootstrap")  # bootstrap, streaming, parallel, fft
+    sampler = config.get("SAMPLER", "plain")  # plain, antithetic, stratified, sobol
+
+    with trace.span("simulate", engine=engine):
+        lower_bound, upper_bound = expected_move_bands(
+            returns,
+            dte,
+            p_itm,
+            engine=engine,
+            n_samples=config.get("N_SAMPLES", 100_000),
+            seed=config.get("SEED"),
+            sampler=sampler,
+            target_error=config.get("TARGET_ERROR"),
+            max_workers=config.get("WORKERS"),
+            weights=sampling_weights(returns, config),
+        )
+    if config.get("CROSS_CHECK", False):
+        with trace.span("cross_check"):
+            cross_check(returns, dte, p_itm)
+
+    return lower_bound, upper_bound
+
+
+@trace.span("plot_expected_move")
+def plot_expected_move(
+    yft: pd.DataFrame,
+    lower_bound: np.ndarray,
+    upper_bound: np.ndarray,
+    dte: int,
+    path: str = "out/expected_move.png",
+) -> tuple[float, float]:
+    """
+    Plots the last year of prices with the expected-move bands and saves it.
+
+    Returns:
+        tuple[float, float]: Lower and upper price at expiration.
+    """
+    import matplotlib.dates as mdates
+    import matplotlib.ticker as mtick
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    # rcParams["font.family"] = "Arial"
+
+    if N_DAYSTOPLOT > len(yft):
+        raise IndexError("Cannot plot more days than `PERIOD`")
+    yft_plot = yft[-N_DAYSTOPLOT:]
+
+    # sns.set_context('talk')
+    # no pyplot state, so plots can be rendered from several threads at once
+    fig = Figure(figsize=(9, 5))
+    ax = fig.subplots()
+    sns.lineplot(
+        x=yft_plot.index[-N_DAYSTOPLOT:],
+        y=yft_plot.Close[-N_DAYSTOPLOT:],
+        ax=ax,
+        color="k",
+    )
+    x_extrapolation = yft_plot.index.max() + np.array(
+        [np.timedelta64(i, "D") for i in range(dte)]
+    )
+
+    ax.fill_between(
+        yft_plot.index,
+        yft_plot.Close,
+        0.98 * yft_plot.Close.min(),
+        color="0.9",
+        # hatch='///',
+        linewidth=0,
+        edgecolor="0.5",
+    )
+
+    sns.despine(ax=ax)
+
+    fmt = "${x:,.0f}"
+    tick = mtick.StrMethodFormatter(fmt)
+    ax.yaxis.set_major_formatter(tick)
+
+    monthyearFmt = mdates.DateFormatter("%b %y")
+    ax.xaxis.set_major_formatter(monthyearFmt)
+
+    ax.plot(x_extrapolation, (lower_bound + 1) * yft_plot.Close.iloc[-1], color="red")
+    ax.plot(x_extrapolation, (upper_bound + 1) * yft_plot.Close.iloc[-1], color="green")
+
+    ax.fill_between(
+        x_extrapolation,
+        (lower_bound + 1) * yft_plot.Close.iloc[-1],
+        (upper_bound + 1) * yft_plot.Close.iloc[-1],
+        color="white",  # '0.8',
+        hatch="///",
+        linewidth=0,
+        edgecolor="0.5",
+    )
+
+    lower_final_price = (lower_bound[-1] + 1) * yft_plot.Close.iloc[-1]
+    upper_final_price = (upper_bound[-1] + 1) * yft_plot.Close.iloc[-1]
+
+    # ax.set_title(
+    #     f"\${TICKER} (${yft_plot.Close.iloc[-1]:.2f}) Expected Delta = {P_ITM} Move of {DTE} DTE based on prev {PERIOD}",
+    #     size=16,
+    # )
+
+    ax.set_title(f"[\${lower_final_price:.2f}, \${upper_final_price:.2f}]")
+
+    ax.set(
+        xlim=(yft_plot.index.min(), x_extrapolation[-1] + np.timedelta64(2, "D")),
+        ylim=(
+            yft_plot.Close.min() * 0.98,
+            1.02
+            * max(
+                yft_plot.Close.max(),
+                ((upper_bound + 1) * yft_plot.Close.iloc[-1]).max(),
+            ),
         ),
-    ),
-)
-
-
-ax.annotate(
-    f"${lower_final_price:.2f}",
-    xy=(x_extrapolation[-1] + np.timedelta64(2, "D"), lower_final_price),
-    # size=14,
-    va="center",
-    color="red",
-    backgroundcolor="white",
-)
-
-ax.annotate(
-    f"${upper_final_price:.2f}",
-    xy=(x_extrapolation[-1] + np.timedelta64(2, "D"), upper_final_price),
-    # size=20,
-    va="center",
-    color="green",
-    backgroundcolor="white",
-)
-
-plt.savefig(
-    "out/expected_move.png",
-    transparent=False,
-    facecolor="white",
-    dpi=300,
-    bbox_inches="tight",
-)
+    )
+
+    ax.annotate(
+        f"${lower_final_price:.2f}",
+        xy=(x_extrapolation[-1] + np.timedelta64(2, "D"), lower_final_price),
+        # size=14,
+        va="center",
+        color="red",
+        backgroundcolor="white",
+    )
+
+    ax.annotate(
+        f"${upper_final_price:.2f}",
+        xy=(x_extrapolation[-1] + np.timedelta64(2, "D"), upper_final_price),
+        # size=20,
+        va="center",
+        color="green",
+        backgroundcolor="white",
+    )
+
+    with trace.span("savefig", dpi=300):
+        fig.savefig(
+            path,
+            transparent=False,
+            facecolor="white",
+            dpi=300,
+            bbox_inches="tight",
+        )
+
+    return lower_final_price, upper_final_price
+
+
+def main(config_path: str = "config/shortput.toml", **overrides) -> None:
+    config = load_config(config_path, **overrides)
+    yft = get_history(config.get("TICKER"), config.get("PERIOD"))
+
+    lower_bound, upper_bound = compute_bands(yft, config)
+    plot_expected_move(yft, lower_bound, upper_bound, config.get("DTE"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,345 @@
-from typing import Literal
+from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
-import seaborn as sns
-import toml
-import yfinance as yf
-from joblib import Parallel, delayed
+import pandas as pd
 
-# plt.rcParams["font.family"] = "Arial"
+from options.expected_move import sampling_weights
+from options.reliability import (
+    THRESHOLDS,
+    band_hit,
+    cumulative_hit_rate,
+    simulate_bounds,
+    sweep_cutoffs,
+)
+from options.simulation import bands_to_target_error, sampler_paths
+from utils import trace
+from utils.config import load_config
+from utils.data import get_history
+from utils.log import log
+
+RESULTS_PATH = Path("out/cache/reliability")
+N_SAMPLES = 2_500  # paths per cutoff without a TARGET_ERROR
+
+
+def results_path(ticker: str, config: dict) -> Path:
+    """
+    Results table of one backtest setup. Everything that changes the result
+    of a cutoff is part of the name.
+    """
+    target_error = config.get("TARGET_ERROR")
+    sampler = config.get("SAMPLER", "plain")
+    paths = (
+        f"te{target_error}"
+        if target_error is not None
+        else f"n{sampler_paths(N_SAMPLES, sampler)}"
+    )
+    key = "_".join(
+        [
+            ticker,
+            f"dte{config.get('DTE')}",
+            f"p{config.get('P_ITM')}",
+            config.get("THRESH", "lower"),
+            config.get("PERIOD"),
+            sampler,
+            paths,
+            f"seed{config.get('SEED')}",
+        ]
+    )
+    weighting = config.get("WEIGHTING", "uniform")
+    if weighting == "exponential":
+        key += f"_hl{float(config.get('HALFLIFE', 250)):g}"
+    elif weighting != "uniform":
+        key += f"_{weighting}"
+    return RESULTS_PATH / f"{key}.parquet"
+
+
+def _load_results(
+    path: Path, yft: pd.DataFrame, ticker: str
+) -> tuple[pd.DataFrame | None, pd.DataFrame]:
+    """
+    Stored results of `path` and the history they refer to (from the stored
+    origin on), or None and `yft` if there are no usable results.
+    """
+    if not path.exists():
+        return None, yft
+
+    stored = pd.read_parquet(path)
+    origin = stored["origin"].iloc[0]
+    history = (get_history(ticker, "max") if origin < yft.index[0] else yft).loc[
+        origin:
+    ]
+
+    cutoffs = stored["cutoff"].to_numpy()
+    if (
+        cutoffs.max() >= len(history)
+        or not (history.index[cutoffs] == stored["date"]).all()
+    ):
+        log.warning(f"Price history of {ticker} changed, rerunning the backtest")
+        return None, yft
+    return stored, history
+
+
+@trace.span("backtest")
+def run_backtest(
+    yft: pd.DataFrame, config: dict, ticker: str | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluates the expected move for every cutoff from the first fifth of the
+    history up to `DTE` days before its end.
+
+    With a `ticker`, the result of every cutoff (bounds, realized close and
+    hit) is stored in `RESULTS_PATH` and later runs only compute the cutoffs
+    that are not stored yet. The first run fixes the origin of the history
+    and the first cutoff, so stored cutoffs keep their meaning as the
+    `PERIOD` window moves forward. Cutoffs are not recomputed when the
+    dividend adjustment of older prices changes.
+
+    Args:
+        yft (pd.DataFrame): Price history of `PERIOD`.
+        config (dict): Short put config.
+        ticker (str | None): Ticker of `yft`; None disables the results table.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Cutoffs and their hit flags.
+    """
+    dte, p_itm = config.get("DTE"), config.get("P_ITM")
+    thresh = config.get("THRESH", "lower")  # lower, upper, both
+    sampler = config.get("SAMPLER", "plain")  # plain, antithetic, stratified, sobol
+    target_error = config.get("TARGET_ERROR")
+    seed = config.get("SEED")
+    weighting = config.get("WEIGHTING", "uniform")  # uniform, exponential, regime
+    halflife = config.get("HALFLIFE", 250)
+
+    stored, path = None, None
+    if ticker is not None and config.get("CHECKPOINT", True):
+        path = results_path(ticker, config)
+        stored, yft = _load_results(path, yft, ticker)
+
+    with trace.span("returns"):
+        returns = yft["Close"].pct_change().fillna(0).values
+        close = yft["Close"].to_numpy()
+
+    if stored is None:
+        cutoffs = np.arange(len(returns) // 5, len(returns) - dte)
+    else:
+        cutoffs = np.arange(stored["cutoff"].min(), len(returns) - dte)
+        cutoffs = np.setdiff1d(cutoffs, stored["cutoff"].to_numpy())
+
+    if len(cutoffs) > 0:
+        # pick the path count per cutoff from a pilot on the full history
+        n_samples = (
+            sampler_paths(N_SAMPLES, sampler)
+            if target_error is None
+            else bands_to_target_error(
+                returns,
+                dte,
+                p_itm,
+                target_error,
+                sampler=sampler,
+                seed=seed,
+                weights=sampling_weights(returns, config),
+            ).n_samples
+        )
+
+        with trace.span("simulate", cutoffs=len(cutoffs), n_samples=n_samples):
+            lower, upper = simulate_bounds(
+                returns,
+                close,
+                cutoffs=cutoffs,
+                dte=dte,
+                p_itm=p_itm,
+                n_samples=n_samples,
+                sampler=sampler,
+                seed=seed,
+                weighting=weighting,
+                halflife=halflife,
+            )
+        new = pd.DataFrame(
+            {
+                "cutoff": cutoffs,
+                "date": yft.index[cutoffs],
+                "lower": lower,
+                "upper": upper,
+                "close": close[cutoffs + dte],
+                "hit": band_hit(lower, upper, close[cutoffs + dte], thresh),
+                "n_samples": n_samples,
+                "origin": yft.index[0],
+            }
+        )
+        stored = new if stored is None else pd.concat([stored, new])
 
-config = toml.load("config/shortput.toml")
-TICKER = config.get("TICKER")
-DTE = config.get("DTE")
-P_ITM = config.get("P_ITM")  # 0.3
-PERIOD = config.get("PERIOD")  # "5y"
+        if path is not None:
+            log.info(f"Stored {len(cutoffs)} new cutoff(s) in {path}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            stored.to_parquet(path, index=False)
 
-yft = yf.Ticker(TICKER).history(PERIOD)
-returns = yft["Close"].pct_change().fillna(0).values
+    if stored is None:
+        log.warning(
+            f"{len(yft)} days of history leave no backtest cutoff for a DTE of {dte}"
+        )
+        return cutoffs, np.empty(0, dtype=bool)
+    stored = stored.sort_values("cutoff")
+    return stored["cutoff"].to_numpy(), stored["hit"].to_numpy()
 
 
-THRESH = "lower"  # lower, upper, both
-start = len(returns) // 5
+def backtest_length(cutoffs: np.ndarray, dte: int, n_days: int) -> int:
+    """
+    Days of history behind the `cutoffs` of `run_backtest` (which may start
+    before `PERIOD`), or `n_days` if there are none.
+    """
+    return int(cutoffs[-1]) + dte + 1 if len(cutoffs) > 0 else n_days
 
 
-def simulate(
-    cutoff, n_samples=2_500, thresh: Literal["lower", "upper", "both"] = "both"
-):
-    samples = np.random.choice(returns[:cutoff], (n_samples, DTE)) + 1
-    final_return = samples.cumprod(axis=1) - 1
+@trace.span("sweep")
+def run_sweep(
+    yft: pd.DataFrame, config: dict, dtes: list[int], p_itms: list[float]
+) -> pd.DataFrame:
+    """
+    Backtests every combination of `dtes`, `p_itms` and threshold from one
+    simulation per cutoff. All combinations share the cutoffs from the first
+    fifth of the history up to the largest DTE before its end.
 
-    lower_bound = np.quantile(final_return[:, -1], P_ITM)
-    upper_bound = np.quantile(final_return[:, -1], 1 - P_ITM)
+    Returns:
+        pd.DataFrame: One row per DTE, P_ITM and threshold with the number
+            of cutoffs and the empirical and theoretical hit probability.
+    """
+    sampler = config.get("SAMPLER", "plain")  # plain, antithetic, stratified, sobol
+    target_error = config.get("TARGET_ERROR")
+    seed = config.get("SEED")
 
-    lower = (lower_bound + 1) * yft["Close"].iloc[cutoff]
-    upper = (upper_bound + 1) * yft["Close"].iloc[cutoff]
-    return (
-        lower < yft["Close"].iloc[cutoff + DTE] < upper
-        if thresh == "both"
-        else yft["Close"].iloc[cutoff + DTE] < upper
-        if thresh == "upper"
-        else yft["Close"].iloc[cutoff + DTE] > lower
+    returns = yft["Close"].pct_change().fillna(0).values
+    cutoffs = np.arange(len(returns) // 5, len(returns) - max(dtes))
+
+    # the longest tenor and the most extreme quantile need the most paths
+    n_samples = (
+        sampler_paths(N_SAMPLES, sampler)
+        if target_error is None
+        else bands_to_target_error(
+            returns,
+            max(dtes),
+            min(p_itms),
+            target_error,
+            sampler=sampler,
+            seed=seed,
+            weights=sampling_weights(returns, config),
+        ).n_samples
     )
 
+    with trace.span("simulate", cutoffs=len(cutoffs), n_samples=n_samples):
+        hits = sweep_cutoffs(
+            returns,
+            yft["Close"].to_numpy(),
+            cutoffs,
+            dtes,
+            p_itms,
+            n_samples=n_samples,
+            sampler=sampler,
+            seed=seed,
+            weighting=config.get("WEIGHTING", "uniform"),
+            halflife=config.get("HALFLIFE", 250),
+        )
 
-result = Parallel(n_jobs=-1)(
-    delayed(simulate)(cutoff, thresh=THRESH)
-    for cutoff in range(start, len(returns) - DTE)
-)
+    grid = pd.MultiIndex.from_product(
+        [dtes, p_itms, THRESHOLDS], names=["dte", "p_itm", "thresh"]
+    ).to_frame(index=False)
+    grid["n_cutoffs"] = len(cutoffs)
+    grid["empirical"] = hits.mean(axis=-1).ravel()
+    grid["theoretical"] = np.where(
+        grid["thresh"] == "both", 1 - 2 * grid["p_itm"], 1 - grid["p_itm"]
+    )
+    grid["difference"] = grid["empirical"] - grid["theoretical"]
+    return grid
 
-fig, ax = plt.subplots(figsize=(9, 4))
-ax.plot(
-    list(range(start, len(returns) - DTE)),
-    (np.array(result).cumsum() / range(1, len(result) + 1)),
-    c="blue",
-    zorder=20,
-)
 
-theoretical_p = (
-    1 - (2 * P_ITM) if THRESH == "both" else 1 - P_ITM
-)  # if THRESH == 'lower' else P_ITM
-ax.axhline(theoretical_p, ls="--", color="k", zorder=5, alpha=0.5)
-labeldict = {
-    "lower": "$price > lower$",
-    "upper": "$price < upper$",
-    "both": "$lower < price < upper$",
-}
-ax.set(
-    # xticks=range(start, len(returns) - DTE),
-    xlabel="Days used for empirical sampling",
-    ylabel=f"Empirical $\mathbf{{{'P'}}}$({labeldict[THRESH]})",
-)
-ax.text(
-    len(returns - DTE - start) + 40,
-    y=theoretical_p,
-    s=f"Theoretical\n$\mathbf{{{'P'}}}$({labeldict[THRESH]})",
-    ha="left",
-    va="center",
-)
-sns.despine()
+@trace.span("plot_reliability")
+def plot_reliability(
+    cutoffs: np.ndarray,
+    result: np.ndarray,
+    n_returns: int,
+    p_itm: float,
+    thresh: str = "lower",
+    path: str = "out/expected_move_reliability.png",
+) -> None:
+    """Plots the cumulative hit rate against the theoretical probability."""
+    import seaborn as sns
+    from matplotlib.figure import Figure
+
+    # rcParams["font.family"] = "Arial"
+
+    fig = Figure(figsize=(9, 4))
+    ax = fig.subplots()
+    ax.plot(
+        list(cutoffs),
+        cumulative_hit_rate(result),
+        c="blue",
+        zorder=20,
+    )
+
+    theoretical_p = (
+        1 - (2 * p_itm) if thresh == "both" else 1 - p_itm
+    )  # if THRESH == 'lower' else P_ITM
+    ax.axhline(theoretical_p, ls="--", color="k", zorder=5, alpha=0.5)
+    labeldict = {
+        "lower": "$price > lower$",
+        "upper": "$price < upper$",
+        "both": "$lower < price < upper$",
+    }
+    ax.set(
+        # xticks=range(start, len(returns) - DTE),
+        xlabel="Days used for empirical sampling",
+        ylabel=f"Empirical $\mathbf{{{'P'}}}$({labeldict[thresh]})",
+    )
+    ax.text(
+        n_returns + 40,
+        y=theoretical_p,
+        s=f"Theoretical\n$\mathbf{{{'P'}}}$({labeldict[thresh]})",
+        ha="left",
+        va="center",
+    )
+    if len(cutoffs) == 0:
+        # no hit rate to scale the axis, keep the label next to it
+        ax.set_xlim(0, n_returns)
+    sns.despine(ax=ax)
+
+    with trace.span("savefig", dpi=300):
+        fig.savefig(path, dpi=300, bbox_inches="tight")
+
+
+def main(
+    config_path: str = "config/shortput.toml",
+    sweep: bool = False,
+    output: str = "out/reliability_sweep",
+    **overrides,
+) -> None:
+    """
+    Plots the reliability of `DTE`/`P_ITM`/`THRESH`, or with `sweep` writes
+    the grid of `SWEEP_DTES` x `SWEEP_P_ITMS` x thresholds to `output`
+    (.csv and .parquet).
+    """
+    config = load_config(config_path, **overrides)
+    yft = get_history(config.get("TICKER"), config.get("PERIOD"))
+
+    if sweep:
+        dtes = config.get("SWEEP_DTES", [config.get("DTE")])
+        p_itms = config.get("SWEEP_P_ITMS", [config.get("P_ITM")])
+        grid = run_sweep(yft, config, dtes, p_itms)
+
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        grid.to_parquet(f"{output}.parquet", index=False)
+        grid.to_csv(f"{output}.csv", index=False)
+        print(grid.pivot(index=["dte", "p_itm"], columns="thresh", values="difference"))
+        log.info(f"Wrote {len(grid)} combinations to {output}.parquet/.csv")
+        return
+
+    cutoffs, result = run_backtest(yft, config, ticker=config.get("TICKER"))
+    plot_reliability(
+        cutoffs,
+        result,
+        n_returns=backtest_length(cutoffs, config.get("DTE"), len(yft)),
+        p_itm=config.get("P_ITM"),
+        thresh=config.get("THRESH", "lower"),
+    )
+
 
-plt.savefig("out/expected_move_reliability.png", dpi=300, bbox_inches="tight")
+if __name__ == "__main__":
+    main()
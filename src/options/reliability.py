@@ -0,0 +1,339 @@
+from typing import Literal
+
+import numpy as np
+
+from options.simulation import (
+    AliasTable,
+    Sampler,
+    Weighting,
+    geometric_indices,
+    sampler_paths,
+    trailing_volatility,
+    uniforms,
+)
+from utils import trace
+
+Thresh = Literal["lower", "upper", "both"]
+THRESHOLDS: tuple[Thresh, ...] = ("lower", "upper", "both")
+
+# regime weighting, see `options.simulation.return_weights`
+REGIME_WINDOW = 21
+REGIME_BANDWIDTH = 0.25
+
+
+def band_hit(lower, upper, realized, thresh: Thresh):
+    """Whether `realized` lies inside the band on the side(s) given by `thresh`."""
+    if thresh == "both":
+        return (lower < realized) & (realized < upper)
+    if thresh == "upper":
+        return realized < upper
+    return realized > lower
+
+
+def simulate(
+    returns: np.ndarray,
+    close: np.ndarray,
+    cutoff: int,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 2_500,
+    thresh: Thresh = "both",
+    seed: int | None = None,
+) -> bool:
+    """
+    Reference implementation for a single cutoff: bootstraps `dte` daily returns
+    from `returns[:cutoff]` and checks whether the close `dte` days after the
+    cutoff ended up inside the expected-move band.
+    """
+    rng = np.random.default_rng(seed)
+    samples = rng.choice(returns[:cutoff], (n_samples, dte)) + 1
+    final_return = samples.cumprod(axis=1) - 1
+
+    lower_bound = np.quantile(final_return[:, -1], p_itm)
+    upper_bound = np.quantile(final_return[:, -1], 1 - p_itm)
+
+    lower = (lower_bound + 1) * close[cutoff]
+    upper = (upper_bound + 1) * close[cutoff]
+    return bool(band_hit(lower, upper, close[cutoff + dte], thresh))
+
+
+def _cutoff_uniforms(
+    rng: np.random.Generator,
+    seed: int | None,
+    batch: np.ndarray,
+    n_samples: int,
+    dte: int,
+    sampler: Sampler,
+) -> np.ndarray:
+    """
+    Uniforms of shape (len(batch), n_samples, dte). With a seed, every cutoff
+    draws from its own stream (`[seed, cutoff]`), so its result does not
+    depend on which other cutoffs are evaluated in the same run.
+    """
+    if seed is None:
+        return uniforms(rng, (len(batch), n_samples, dte), sampler)
+
+    u = np.empty((len(batch), n_samples, dte))
+    for i, cutoff in enumerate(batch):
+        cutoff_rng = np.random.default_rng([seed, int(cutoff)])
+        u[i] = uniforms(cutoff_rng, (n_samples, dte), sampler)
+    return u
+
+
+def _cutoff_weights(
+    log_returns: np.ndarray, batch: np.ndarray, weighting: Weighting, halflife: float
+) -> np.ndarray:
+    """
+    Weights of shape (batch, batch.max()) of the returns before every cutoff
+    in `batch` and zero after it, like `options.simulation.return_weights` of
+    `log_returns[:cutoff]` (up to a constant factor per cutoff).
+    """
+    width = batch.max()
+    past = np.arange(width) < batch[:, None]
+    if weighting == "exponential":
+        age = np.maximum(batch[:, None] - 1 - np.arange(width), 0)
+        weights = 0.5 ** (age / halflife)
+    elif weighting == "regime":
+        volatility = trailing_volatility(log_returns[:width], REGIME_WINDOW)
+        log_volatility = np.log(volatility)
+        distance = (log_volatility - log_volatility[batch - 1, None]) / REGIME_BANDWIDTH
+        weights = np.exp(-0.5 * distance**2)
+    else:
+        raise ValueError(f"Unknown weighting: {weighting}")
+    return np.where(past, weights, 0.0)
+
+
+def _cutoff_paths(
+    log_returns: np.ndarray,
+    u: np.ndarray,
+    batch: np.ndarray,
+    sampler: Sampler,
+    weighting: Weighting,
+    halflife: float,
+) -> np.ndarray:
+    """
+    Log returns of shape `u` (batch, n_samples, dte), resampled from
+    `log_returns[:cutoff]` of every cutoff in `batch`.
+
+    Plain uniforms index the returns directly, other samplers go through the
+    sorted prefix of each cutoff. Exponential weights of plain draws use the
+    closed-form geometric inverse CDF, so nothing depends on the cutoff but
+    its length. Otherwise the weights of all cutoffs come from one pass over
+    the history (the trailing volatility of "regime" is causal, so it is the
+    same for every prefix) and each cutoff draws from an alias table of its
+    row, in the order of the sorted prefix for non-plain samplers. The table
+    is built with NumPy prefix sums, so a cutoff costs a few array calls
+    rather than a Python loop over its history. The cutoffs themselves are
+    still looped over: one table over all rows of the batch was measured
+    slower, as its temporaries outgrow the cache that a single row fits in.
+    """
+    if sampler == "plain":
+        values, width = log_returns, 0
+    else:
+        # empirical CDF of every cutoff: its sorted prefix, padded with inf
+        width = batch.max()
+        prefix = np.where(
+            np.arange(width) < batch[:, None], log_returns[:width], np.inf
+        )
+        order = np.argsort(prefix, axis=1, kind="stable")
+        values = np.take_along_axis(prefix, order, axis=1).ravel()
+
+    if weighting == "uniform":
+        idx = (u * batch[:, None, None]).astype(np.int64)
+    elif weighting == "exponential" and sampler == "plain":
+        idx = geometric_indices(u, batch[:, None, None], halflife)
+    else:
+        weights = _cutoff_weights(log_returns, batch, weighting, halflife)
+        if sampler != "plain":
+            weights = np.take_along_axis(weights, order, axis=1)
+        # per cutoff, see above; regime weights and sorted prefixes differ
+        # between cutoffs, so there is no shared cumulative weight array either
+        idx = np.empty(u.shape, dtype=np.int64)
+        for i, cutoff in enumerate(batch):
+            idx[i] = AliasTable(weights[i, :cutoff]).indices(u[i])
+
+    if width:
+        idx += (np.arange(len(batch)) * width)[:, None, None]
+    return values[idx]
+
+
+def simulate_bounds(
+    returns: np.ndarray,
+    close: np.ndarray,
+    cutoffs: np.ndarray,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 2_500,
+    seed: int | None = None,
+    memory_budget: int = 256 * 2**20,
+    sampler: Sampler = "plain",
+    weighting: Weighting = "uniform",
+    halflife: float = 250.0,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Batched version of `simulate` that evaluates many cutoffs in one NumPy pass.
+
+    For every cutoff, indices into `returns[:cutoff]` are drawn by scaling
+    uniform samples by the cutoff. Paths are summed in log space and the
+    quantiles are taken over the batch.
+
+    Args:
+        returns (np.ndarray): Daily simple returns, aligned with `close`.
+        close (np.ndarray): Daily closing prices.
+        cutoffs (np.ndarray): Indices of the evaluation days.
+        dte (int): Days to expiration.
+        p_itm (float): Probability of the option ending in the money.
+        n_samples (int): Bootstrapped paths per cutoff (rounded up to a power
+            of two for "sobol", see `options.simulation.sampler_paths`).
+        seed (int | None): Seed for the random generator; the result of a
+            cutoff only depends on the seed and the cutoff itself.
+        memory_budget (int): Upper bound in bytes for the temporary arrays of one batch.
+        sampler (Sampler): Variance reduction, see `options.simulation.uniforms`.
+            Non-plain samplers draw through the sorted returns of each cutoff.
+        weighting (Weighting): Sampling weights of the returns before each
+            cutoff, see `options.simulation.return_weights`.
+        halflife (float): Halflife in days of the "exponential" weighting.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Lower and upper price bound per cutoff.
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    close = np.asarray(close, dtype=np.float64)
+    cutoffs = np.asarray(cutoffs, dtype=np.int64)
+    n_samples = sampler_paths(n_samples, sampler)
+    rng = np.random.default_rng(seed)
+
+    # uniforms, indices and gathered returns of one cutoff (8 bytes each)
+    bytes_per_cutoff = 3 * 8 * n_samples * dte
+    batch_size = max(1, memory_budget // bytes_per_cutoff)
+
+    lower, upper = np.empty(len(cutoffs)), np.empty(len(cutoffs))
+    for start in range(0, len(cutoffs), batch_size):
+        batch = cutoffs[start : start + batch_size]
+        u = _cutoff_uniforms(rng, seed, batch, n_samples, dte, sampler)
+        paths = _cutoff_paths(log_returns, u, batch, sampler, weighting, halflife)
+        final_return = np.expm1(paths.sum(axis=2))
+
+        with trace.span("quantiles"):
+            lower_bound, upper_bound = np.quantile(
+                final_return, [p_itm, 1 - p_itm], axis=1
+            )
+        lower[start : start + len(batch)] = (lower_bound + 1) * close[batch]
+        upper[start : start + len(batch)] = (upper_bound + 1) * close[batch]
+
+    return lower, upper
+
+
+def simulate_cutoffs(
+    returns: np.ndarray,
+    close: np.ndarray,
+    cutoffs: np.ndarray,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 2_500,
+    thresh: Thresh = "both",
+    seed: int | None = None,
+    memory_budget: int = 256 * 2**20,
+    sampler: Sampler = "plain",
+    weighting: Weighting = "uniform",
+    halflife: float = 250.0,
+) -> np.ndarray:
+    """
+    Hit flag per cutoff: whether the close `dte` days after it ended up
+    inside the expected-move band (see `simulate_bounds` for the arguments).
+
+    Args:
+        thresh (Thresh): Which side(s) of the band count as a hit.
+
+    Returns:
+        np.ndarray: Boolean hit flag per cutoff.
+    """
+    cutoffs = np.asarray(cutoffs, dtype=np.int64)
+    lower, upper = simulate_bounds(
+        returns,
+        close,
+        cutoffs,
+        dte,
+        p_itm,
+        n_samples=n_samples,
+        seed=seed,
+        memory_budget=memory_budget,
+        sampler=sampler,
+        weighting=weighting,
+        halflife=halflife,
+    )
+    return band_hit(lower, upper, np.asarray(close)[cutoffs + dte], thresh)
+
+
+def sweep_cutoffs(
+    returns: np.ndarray,
+    close: np.ndarray,
+    cutoffs: np.ndarray,
+    dtes: list[int],
+    p_itms: list[float],
+    n_samples: int = 2_500,
+    seed: int | None = None,
+    memory_budget: int = 256 * 2**20,
+    sampler: Sampler = "plain",
+    weighting: Weighting = "uniform",
+    halflife: float = 250.0,
+) -> np.ndarray:
+    """
+    Hit flags of many DTE and P_ITM combinations from one simulation.
+
+    Paths are simulated once per cutoff up to the largest DTE; every DTE is
+    read from the cumulative log returns and all quantile levels are taken
+    in one pass. `cutoffs + max(dtes)` must lie within `close`.
+
+    Args:
+        dtes (list[int]): Days to expiration.
+        p_itms (list[float]): Probabilities of the option ending in the money.
+        See `simulate_bounds` for the other arguments.
+
+    Returns:
+        np.ndarray: Boolean hits of shape (len(dtes), len(p_itms), 3, len(cutoffs)),
+            the third axis following `THRESHOLDS`.
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    close = np.asarray(close, dtype=np.float64)
+    cutoffs = np.asarray(cutoffs, dtype=np.int64)
+    horizons = np.asarray(dtes, dtype=np.int64)
+    max_dte = int(horizons.max())
+    levels = np.concatenate([p_itms, 1 - np.asarray(p_itms)])
+    n_samples = sampler_paths(n_samples, sampler)
+    rng = np.random.default_rng(seed)
+
+    bytes_per_cutoff = 3 * 8 * n_samples * max_dte
+    batch_size = max(1, memory_budget // bytes_per_cutoff)
+
+    hits = np.empty((len(dtes), len(p_itms), 3, len(cutoffs)), dtype=bool)
+    for start in range(0, len(cutoffs), batch_size):
+        batch = cutoffs[start : start + batch_size]
+        u = _cutoff_uniforms(rng, seed, batch, n_samples, max_dte, sampler)
+        paths = _cutoff_paths(log_returns, u, batch, sampler, weighting, halflife)
+        del u
+
+        # (batch, n_samples, len(dtes)) returns at every requested horizon
+        final_return = np.expm1(paths.cumsum(axis=2)[:, :, horizons - 1])
+        del paths
+
+        with trace.span("quantiles", levels=len(levels)):
+            # (levels, batch, dtes), one partition for all levels
+            bounds = np.quantile(final_return, levels, axis=1) + 1
+        bounds *= close[batch][None, :, None]
+        lower, upper = bounds[: len(p_itms)], bounds[len(p_itms) :]
+
+        # (dtes, batch) realized closes, broadcast against (p_itms, batch, dtes)
+        realized = close[batch[None, :] + horizons[:, None]].T[None]
+        above, below = realized > lower, realized < upper
+        window = slice(start, start + len(batch))
+        hits[:, :, 0, window] = above.transpose(2, 0, 1)
+        hits[:, :, 1, window] = below.transpose(2, 0, 1)
+        hits[:, :, 2, window] = (above & below).transpose(2, 0, 1)
+
+    return hits
+
+
+def cumulative_hit_rate(hits: np.ndarray) -> np.ndarray:
+    """Running share of hits over the evaluated cutoffs."""
+    return np.cumsum(hits) / np.arange(1, len(hits) + 1)
@@ -0,0 +1,188 @@
+"""
+Watchlist scanner: expected-move bands for many tickers and DTEs in one run.
+
+Histories are fetched in bulk, the return arrays are placed in shared memory
+once and the bands are computed on a process pool. The result is one table of
+strikes and band widths, ranked by relative band width per DTE.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from options.simulation import check_engine, expected_move_bands
+from utils.config import load_config
+from utils.data import get_histories
+from utils.log import log
+
+# set in each worker by `_attach_returns`
+_shm: shared_memory.SharedMemory | None = None
+_returns: np.ndarray | None = None
+
+
+def _attach_returns(name: str, size: int) -> None:
+    """Pool initializer: maps the shared return buffer into the worker."""
+    global _returns, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    _returns = np.ndarray((size,), dtype=np.float64, buffer=_shm.buf)
+
+
+def _bands(
+    offset: int, length: int, dtes: list[int], p_itm: float, engine: str, **kwargs
+) -> list[tuple]:
+    """Simulates once up to the largest DTE and reads off every requested tenor."""
+    returns = _returns[offset : offset + length]
+    lower_bound, upper_bound = expected_move_bands(
+        returns, max(dtes), p_itm, engine=engine, **kwargs
+    )
+    return [(dte, lower_bound[dte - 1], upper_bound[dte - 1]) for dte in dtes]
+
+
+def scan(
+    tickers: list[str],
+    dtes: list[int],
+    p_itm: float,
+    period: str = "2y",
+    engine: str = "fft",
+    n_samples: int = 100_000,
+    seed: int | None = None,
+    sampler: str = "plain",
+    target_error: float | None = None,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """
+    Computes expected-move bands for all `tickers` and `dtes`.
+
+    Args:
+        tickers (list[str]): Ticker symbols to scan.
+        dtes (list[int]): Days to expiration to report.
+        p_itm (float): Probability of the option ending in the money.
+        period (str): History used for the bootstrap.
+        engine (str): Band engine, see `options.simulation.expected_move_bands`.
+        n_samples (int): Paths per ticker for the Monte Carlo engines.
+        seed (int | None): Seed for the Monte Carlo engines.
+        sampler (str): Variance reduction for the "bootstrap" engine.
+        target_error (float | None): Standard error that picks the number of
+            paths automatically ("bootstrap" engine).
+        max_workers (int | None): Size of the process pool (default: all cores).
+
+    Returns:
+        pd.DataFrame: One row per ticker and DTE with strikes and band widths.
+    """
+    check_engine(engine, sampler, target_error)
+    histories = get_histories(tickers, period)
+    closes = {t: h["Close"].dropna() for t, h in histories.items()}
+    returns = {t: c.pct_change().dropna().to_numpy() for t, c in closes.items()}
+    returns = {t: r for t, r in returns.items() if len(r) > 0}
+
+    engine_kwargs = {
+        "n_samples": n_samples,
+        "seed": seed,
+        "sampler": sampler,
+        "target_error": target_error,
+        # the tickers already use all cores
+        "max_workers": 1,
+    }
+    offsets = np.cumsum([0] + [len(r) for r in returns.values()])
+    shm = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]) * 8, 1))
+    try:
+        shared = np.ndarray((offsets[-1],), dtype=np.float64, buffer=shm.buf)
+        for offset, r in zip(offsets, returns.values()):
+            shared[offset : offset + len(r)] = r
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            initializer=_attach_returns,
+            initargs=(shm.name, int(offsets[-1])),
+        ) as pool:
+            futures = {
+                ticker: pool.submit(
+                    _bands,
+                    int(offset),
+                    len(r),
+                    sorted(set(dtes)),
+                    p_itm,
+                    engine,
+                    **engine_kwargs,
+                )
+                for ticker, offset, r in zip(returns, offsets, returns.values())
+            }
+            rows = []
+            for ticker, future in futures.items():
+                last_close = closes[ticker].iloc[-1]
+                try:
+                    bands = future.result()
+                except Exception as e:
+                    log.warning(f"Could not compute bands for {ticker}: {e}")
+                    continue
+                for dte, lower, upper in bands:
+                    rows.append(
+                        {
+                            "ticker": ticker,
+                            "dte": dte,
+                            "last_close": last_close,
+                            "lower_strike": (lower + 1) * last_close,
+                            "upper_strike": (upper + 1) * last_close,
+                            "lower_move": lower,
+                            "upper_move": upper,
+                        }
+                    )
+    finally:
+        shm.close()
+        shm.unlink()
+
+    table = pd.DataFrame(rows)
+    if table.empty:
+        return table
+
+    table["band_width"] = table["upper_strike"] - table["lower_strike"]
+    table["band_width_pct"] = table["band_width"] / table["last_close"]
+    table = table.sort_values(["dte", "band_width_pct"], ascending=[True, False])
+    table["rank"] = table.groupby("dte").cumcount() + 1
+    return table.reset_index(drop=True)
+
+
+def main(
+    config_path: str = "config/watchlist.toml",
+    sampler: str | None = None,
+    target_error: float | None = None,
+    engine: str | None = None,
+) -> None:
+    """
+    Scans `TICKERS` and writes the table to `OUTPUT` (.csv and .parquet).
+
+    Only the bootstrap engine uses a sampler or target error, so passing
+    either without an `engine` selects it over `ENGINE` of the config.
+    """
+    if engine is None and (sampler not in (None, "plain") or target_error is not None):
+        log.info("Using the bootstrap engine for the sampler and target error")
+        engine = "bootstrap"
+    config = load_config(
+        config_path, ENGINE=engine, SAMPLER=sampler, TARGET_ERROR=target_error
+    )
+    output = Path(config.get("OUTPUT", "out/scanner"))
+
+    table = scan(
+        tickers=config.get("TICKERS"),
+        dtes=config.get("DTES", [30]),
+        p_itm=config.get("P_ITM", 0.3),
+        period=config.get("PERIOD", "2y"),
+        engine=config.get("ENGINE", "fft"),
+        n_samples=config.get("N_SAMPLES", 100_000),
+        seed=config.get("SEED"),
+        sampler=config.get("SAMPLER", "plain"),
+        target_error=config.get("TARGET_ERROR"),
+    )
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    table.to_parquet(output.with_suffix(".parquet"), index=False)
+    table.to_csv(output.with_suffix(".csv"), index=False)
+    log.info(f"Wrote {len(table)} rows to {output}.parquet/.csv")
+
+
+if __name__ == "__main__":
+    main()
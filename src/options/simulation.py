@@ -0,0 +1,777 @@
+"""
+Engines for the bootstrapped expected-move bands.
+
+All engines resample daily returns i.i.d. (optionally weighted, see
+`return_weights`) and return the `p_itm` and
+`1 - p_itm` quantiles of the cumulative return for every horizon `1..dte`
+(as simple returns, like `final_return` in `expected_move.py`).
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Literal, NamedTuple
+
+import numpy as np
+
+from utils import trace
+from utils.log import log
+
+Engine = Literal["bootstrap", "streaming", "parallel", "fft"]
+Sampler = Literal["plain", "antithetic", "stratified", "sobol"]
+Weighting = Literal["uniform", "exponential", "regime"]
+
+
+def bootstrap_bands(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 100_000,
+    seed: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Materializes all paths and takes exact quantiles per horizon."""
+    rng = np.random.default_rng(seed)
+    samples = rng.choice(returns, (n_samples, dte)) + 1
+    final_return = samples.cumprod(axis=1) - 1
+
+    with trace.span("quantiles"):
+        lower_bound = np.quantile(final_return, p_itm, axis=0)
+        upper_bound = np.quantile(final_return, 1 - p_itm, axis=0)
+    return lower_bound, upper_bound
+
+
+class Bands(NamedTuple):
+    """Band estimate with the standard error of each quantile per horizon."""
+
+    lower: np.ndarray
+    upper: np.ndarray
+    lower_error: np.ndarray
+    upper_error: np.ndarray
+    n_samples: int
+
+
+def uniforms(
+    rng: np.random.Generator, shape: tuple[int, ...], sampler: Sampler = "plain"
+) -> np.ndarray:
+    """
+    Uniform draws of `shape` (..., n_paths, dte) for the given sampler.
+
+    - "plain": independent uniforms.
+    - "antithetic": the second half of the paths mirrors the first (u -> 1 - u).
+    - "stratified": every day is Latin-hypercube sampled across the paths.
+    - "sobol": scrambled Sobol points, one dimension per day. `n_paths` must
+      be a power of two (see `sampler_paths`); the batch rows are consecutive
+      blocks of one sequence, each balanced on its own.
+    """
+    *batch, n_paths, dte = shape
+    if sampler == "plain":
+        return rng.random(shape)
+
+    if sampler == "antithetic":
+        u = rng.random((*batch, (n_paths + 1) // 2, dte))
+        return np.concatenate([u, 1 - u], axis=-2)[..., :n_paths, :]
+
+    if sampler == "stratified":
+        strata = np.broadcast_to(np.arange(n_paths)[:, None], shape)
+        return (rng.permuted(strata, axis=-2) + rng.random(shape)) / n_paths
+
+    if sampler == "sobol":
+        from scipy.stats import qmc
+
+        if n_paths & (n_paths - 1):
+            raise ValueError(
+                f"The sobol sampler needs a power of two paths, got {n_paths}"
+            )
+        engine = qmc.Sobol(d=dte, scramble=True, seed=rng)
+        u = engine.random_base2(n_paths.bit_length() - 1)
+        n_blocks = int(np.prod(batch))
+        if n_blocks > 1:
+            u = np.concatenate([u, engine.random((n_blocks - 1) * n_paths)])
+        return u.reshape(shape)
+
+    raise ValueError(f"Unknown sampler: {sampler}")
+
+
+def sampler_paths(n_paths: int, sampler: Sampler) -> int:
+    """Paths per draw that keep `sampler` balanced (a power of two for "sobol")."""
+    if sampler == "sobol":
+        return 1 << max(int(n_paths) - 1, 0).bit_length()
+    return n_paths
+
+
+def check_engine(
+    engine: Engine, sampler: Sampler = "plain", target_error: float | None = None
+) -> None:
+    """Raises if `sampler` or `target_error` is set for an engine that ignores it."""
+    if engine != "bootstrap" and (sampler != "plain" or target_error is not None):
+        raise ValueError(
+            f"The {engine} engine supports neither samplers nor a target error "
+            f"(got sampler={sampler!r}, target_error={target_error}), "
+            "use the bootstrap engine"
+        )
+
+
+def trailing_volatility(log_returns: np.ndarray, window: int = 21) -> np.ndarray:
+    """
+    Standard deviation of the last `window` log returns up to and including
+    each day (fewer at the start of the history).
+    """
+    x = np.asarray(log_returns, dtype=np.float64)
+    first = np.concatenate([[0.0], np.cumsum(x)])
+    second = np.concatenate([[0.0], np.cumsum(x**2)])
+    end = np.arange(1, len(x) + 1)
+    start = np.maximum(end - window, 0)
+    count = end - start
+    mean = (first[end] - first[start]) / count
+    variance = (second[end] - second[start]) / count - mean**2
+    return np.sqrt(np.maximum(variance, 1e-12))
+
+
+def return_weights(
+    log_returns: np.ndarray,
+    weighting: Weighting = "uniform",
+    halflife: float = 250.0,
+    regime_window: int = 21,
+    regime_bandwidth: float = 0.25,
+) -> np.ndarray | None:
+    """
+    Sampling weight of every daily return, oldest first.
+
+    - "uniform": all returns are equally likely (None).
+    - "exponential": the weight halves every `halflife` days into the past.
+    - "regime": days whose trailing volatility (`regime_window` days) is close
+      to the current one are preferred, with a Gaussian kernel of width
+      `regime_bandwidth` on the log volatility.
+    """
+    n = len(log_returns)
+    if weighting == "uniform":
+        return None
+    if weighting == "exponential":
+        return 0.5 ** (np.arange(n - 1, -1, -1) / halflife)
+    if weighting == "regime":
+        log_volatility = np.log(trailing_volatility(log_returns, regime_window))
+        distance = (log_volatility - log_volatility[-1]) / regime_bandwidth
+        return np.exp(-0.5 * distance**2)
+    raise ValueError(f"Unknown weighting: {weighting}")
+
+
+class AliasTable:
+    """
+    Vose alias table for drawing indices with fixed weights in O(1) per draw.
+
+    Each of the `n` columns holds its own index with probability `prob` and
+    an alias otherwise. One uniform per draw suffices: its integer part (of
+    `u * n`) picks the column and its fractional part the side, so equal
+    weights map uniforms exactly like `(u * n).astype(int)`.
+    """
+
+    def __init__(self, weights: np.ndarray) -> None:
+        weights = np.asarray(weights, dtype=np.float64)
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+
+        # sweep in prefix sums instead of a Python worklist: every small column
+        # is filled by the first large index whose cumulative surplus reaches
+        # the start of its cumulative deficit, and a large index that drops
+        # below 1 is filled by the next large one
+        small = np.flatnonzero(scaled < 1)
+        large = np.flatnonzero(scaled >= 1)
+        if len(small) and len(large):
+            deficit = 1 - scaled[small]
+            end = np.cumsum(deficit)
+            start = end - deficit
+            surplus = np.cumsum(scaled[large] - 1)
+            donor = np.searchsorted(surplus, start)
+            np.minimum(donor, len(large) - 1, out=donor)
+            self.prob[small], self.alias[small] = scaled[small], large[donor]
+
+            served = np.searchsorted(start, surplus[:-1], side="right")
+            overshoot = np.where(served > 0, end[served - 1], 0.0) - surplus[:-1]
+            self.prob[large[:-1]] = 1 - np.clip(overshoot, 0, 1)
+            self.alias[large[:-1]] = large[1:]
+        # the last large index is 1 up to rounding and keeps prob = 1
+        # column + prob, so the fractional part needs no extra pass
+        self._threshold = np.arange(n) + self.prob
+
+    def indices(self, u: np.ndarray) -> np.ndarray:
+        """Maps uniforms in [0, 1) to weighted indices of the same shape."""
+        n = len(self.prob)
+        scaled = u * n
+        column = scaled.astype(np.int64)
+        np.minimum(column, n - 1, out=column)
+        return np.where(scaled < self._threshold[column], column, self.alias[column])
+
+
+def geometric_indices(u: np.ndarray, n: np.ndarray, halflife: float) -> np.ndarray:
+    """
+    Exponentially weighted indices into the first `n` returns (broadcast
+    against `u`) by the closed-form inverse CDF of the truncated geometric
+    distribution of the age, so no table is needed for any `n`.
+    """
+    decay = 0.5 ** (1 / halflife)
+    age = u * (decay**n - 1)
+    np.log1p(age, out=age)
+    age *= 1 / np.log(decay)
+    # ages are >= 0, so truncation is the floor
+    idx = np.subtract(n - 1, age.astype(np.int64))
+    return np.maximum(idx, 0, out=idx)
+
+
+def _resample_indices(u: np.ndarray, n: int, table: AliasTable | None) -> np.ndarray:
+    """Indices into `n` returns, uniform or from the alias `table`."""
+    if table is not None:
+        return table.indices(u)
+    idx = (u * n).astype(np.int64)
+    np.minimum(idx, n - 1, out=idx)
+    return idx
+
+
+def estimate_bands(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 100_000,
+    sampler: Sampler = "plain",
+    n_replicates: int = 16,
+    seed: int | None = None,
+    weights: np.ndarray | None = None,
+) -> Bands:
+    """
+    Bootstrap bands with an accuracy estimate.
+
+    Uniforms from `sampler` are mapped through the empirical CDF of the daily
+    log returns (i.e. into the sorted returns), so antithetic and stratified
+    draws pair/spread out the actual return values. The paths are split into
+    `n_replicates` independent replicates (of a power of two paths for
+    "sobol", see `sampler_paths`), the bands are the mean of the
+    replicate quantiles and their spread gives the standard error. With
+    `weights` (per return), the sorted returns are drawn from an alias table.
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    order = np.argsort(log_returns, kind="stable")
+    sorted_returns = log_returns[order]
+    table = None if weights is None else AliasTable(np.asarray(weights)[order])
+    rng = np.random.default_rng(seed)
+    n_paths = sampler_paths(max(2, n_samples // n_replicates), sampler)
+
+    lower, upper = np.empty((n_replicates, dte)), np.empty((n_replicates, dte))
+    for r in range(n_replicates):
+        u = uniforms(rng, (n_paths, dte), sampler)
+        idx = _resample_indices(u, len(sorted_returns), table)
+        final_return = np.expm1(sorted_returns[idx].cumsum(axis=1))
+        with trace.span("quantiles"):
+            lower[r], upper[r] = np.quantile(final_return, [p_itm, 1 - p_itm], axis=0)
+
+    return Bands(
+        lower=lower.mean(axis=0),
+        upper=upper.mean(axis=0),
+        lower_error=lower.std(axis=0, ddof=1) / np.sqrt(n_replicates),
+        upper_error=upper.std(axis=0, ddof=1) / np.sqrt(n_replicates),
+        n_samples=n_paths * n_replicates,
+    )
+
+
+def bands_to_target_error(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    target_error: float,
+    sampler: Sampler = "plain",
+    n_replicates: int = 16,
+    initial_samples: int = 2**11,
+    max_samples: int = 2**22,
+    seed: int | None = None,
+    weights: np.ndarray | None = None,
+) -> Bands:
+    """
+    Picks the number of paths automatically: starts with `initial_samples` and
+    grows the sample (assuming the error shrinks with 1/sqrt(n)) until the
+    standard error of both bands at `dte` is below `target_error`.
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = initial_samples
+    while True:
+        bands = estimate_bands(
+            returns,
+            dte,
+            p_itm,
+            n_samples,
+            sampler,
+            n_replicates,
+            seed=rng,
+            weights=weights,
+        )
+        error = max(bands.lower_error[-1], bands.upper_error[-1])
+        if error <= target_error or n_samples >= max_samples:
+            break
+
+        required = n_samples * (error / target_error) ** 2
+        # powers of two keep the Sobol replicates balanced
+        n_samples = min(max_samples, 1 << int(np.ceil(np.log2(required * 1.1))))
+
+    if error > target_error:
+        log.warning(
+            f"Standard error {error:.5f} above target {target_error} "
+            f"with the maximum of {n_samples} paths"
+        )
+    return bands
+
+
+def horizon_quantiles(
+    returns: np.ndarray,
+    horizons: np.ndarray,
+    levels: np.ndarray,
+    n_samples: int = 100_000,
+    seed: int | None = None,
+    sampler: Sampler = "plain",
+    memory_budget: int = 64 * 2**20,
+    weights: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Quantiles of the cumulative return at several horizons from one set of
+    paths simulated up to the longest horizon.
+
+    Paths are generated in chunks and only their value at `horizons` is
+    kept, so memory grows with the number of horizons and not their length.
+
+    Args:
+        returns (np.ndarray): Daily simple returns to resample from.
+        horizons (np.ndarray): Horizons in trading days (>= 1).
+        levels (np.ndarray): Quantile levels.
+        n_samples (int): Number of simulated paths (see `sampler_paths`).
+        seed (int | None): Seed for the random generator.
+        sampler (Sampler): Variance reduction, see `uniforms` (per chunk).
+        memory_budget (int): Upper bound in bytes for the arrays of one chunk.
+        weights (np.ndarray | None): Sampling weight per return, see
+            `return_weights`.
+
+    Returns:
+        np.ndarray: Simple returns of shape (len(levels), len(horizons)).
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    order = np.argsort(log_returns, kind="stable")
+    sorted_returns = log_returns[order]
+    table = None if weights is None else AliasTable(np.asarray(weights)[order])
+    horizons = np.asarray(horizons, dtype=np.int64)
+    max_horizon = int(horizons.max())
+    rng = np.random.default_rng(seed)
+
+    # uniforms, indices and gathered returns per element
+    chunk_size = max(1, memory_budget // (24 * max_horizon))
+    n_samples = sampler_paths(n_samples, sampler)
+    if sampler == "sobol":
+        # equal power of two chunks, so every chunk stays balanced
+        chunk_size = min(1 << (chunk_size.bit_length() - 1), n_samples)
+    final_return = np.empty((n_samples, len(horizons)))
+    for start in range(0, n_samples, chunk_size):
+        n = min(chunk_size, n_samples - start)
+        u = uniforms(rng, (n, max_horizon), sampler)
+        idx = _resample_indices(u, len(sorted_returns), table)
+        paths = sorted_returns[idx].cumsum(axis=1)
+        final_return[start : start + n] = paths[:, horizons - 1]
+
+    with trace.span("quantiles", levels=len(levels)):
+        return np.expm1(np.quantile(final_return, levels, axis=0))
+
+
+class QuantileHistogram:
+    """
+    Mergeable quantile sketch with one fixed-width histogram per horizon.
+
+    The bin range of horizon `h` only depends on the daily log returns
+    (mean * h +- `n_sigma` * std * sqrt(h), clipped to the support), so sketches
+    built from the same returns can be merged by adding their counts.
+    Values outside the range go to an under- and an overflow bin.
+    """
+
+    def __init__(
+        self,
+        log_returns: np.ndarray,
+        dte: int,
+        n_bins: int = 4096,
+        n_sigma: float = 8.0,
+    ) -> None:
+        horizons = np.arange(1, dte + 1)
+        mean, std = log_returns.mean(), log_returns.std()
+        half_width = n_sigma * max(std, 1e-12) * np.sqrt(horizons)
+
+        self.n_bins = n_bins
+        self.lo = np.maximum(mean * horizons - half_width, log_returns.min() * horizons)
+        hi = np.minimum(mean * horizons + half_width, log_returns.max() * horizons)
+        self.width = np.maximum(hi - self.lo, 1e-12) / n_bins
+        self.counts = np.zeros((dte, n_bins + 2), dtype=np.int64)
+
+    def update(self, paths: np.ndarray) -> None:
+        """Adds cumulative log-return paths of shape (n_paths, dte)."""
+        bins = paths - self.lo.astype(paths.dtype)
+        bins /= self.width.astype(paths.dtype)
+        np.floor(bins, out=bins)
+        np.clip(bins, -1, self.n_bins, out=bins)
+        bins = bins.astype(np.int64) + 1
+        bins += np.arange(paths.shape[1]) * (self.n_bins + 2)
+        self.counts += np.bincount(bins.ravel(), minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+
+    def merge(self, other: "QuantileHistogram") -> "QuantileHistogram":
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q: float) -> np.ndarray:
+        """Log-return quantile `q` per horizon, interpolated inside the bin."""
+        cumulative = self.counts.cumsum(axis=1)
+        rank = q * cumulative[:, -1]
+
+        quantiles = np.empty(len(self.counts))
+        for h, (cum, r) in enumerate(zip(cumulative, rank)):
+            b = int(np.searchsorted(cum, r, side="left"))
+            if b == 0 or b == self.n_bins + 1:
+                raise ValueError(
+                    f"Quantile {q} of horizon {h + 1} is outside the histogram range."
+                )
+            below = cum[b - 1]
+            fraction = (r - below) / max(cum[b] - below, 1)
+            quantiles[h] = self.lo[h] + (b - 1 + fraction) * self.width[h]
+
+        return quantiles
+
+
+def streaming_bands(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 1_000_000,
+    seed: int | None = None,
+    memory_budget: int = 64 * 2**20,
+    n_bins: int = 4096,
+    weights: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generates the paths in chunks and only keeps a `QuantileHistogram`, so peak
+    memory is set by `memory_budget` and not by `n_samples`.
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    sketch = QuantileHistogram(log_returns, dte, n_bins=n_bins)
+    _fill_histogram(
+        sketch,
+        log_returns.astype(np.float32),
+        n_samples,
+        np.random.default_rng(seed),
+        memory_budget,
+        table=None if weights is None else AliasTable(weights),
+    )
+
+    with trace.span("quantiles"):
+        return np.expm1(sketch.quantile(p_itm)), np.expm1(sketch.quantile(1 - p_itm))
+
+
+def _fill_histogram(
+    sketch: QuantileHistogram,
+    log_returns: np.ndarray,
+    n_paths: int,
+    rng: np.random.Generator,
+    memory_budget: int,
+    table: AliasTable | None = None,
+) -> None:
+    """
+    Adds `n_paths` resampled paths of float32 `log_returns` to `sketch`,
+    drawn from the alias `table` if given.
+    """
+    dte = len(sketch.counts)
+    # int64 indices, float32 paths, float32 and int64 bins per element
+    chunk_size = max(1, memory_budget // (24 * dte))
+    for start in range(0, n_paths, chunk_size):
+        n = min(chunk_size, n_paths - start)
+        if table is None:
+            idx = rng.integers(0, len(log_returns), (n, dte))
+        else:
+            idx = table.indices(rng.random((n, dte)))
+        paths = log_returns[idx]
+        sketch.update(paths.cumsum(axis=1, dtype=np.float32))
+
+
+# set in each worker by `_attach_log_returns`
+_shm: shared_memory.SharedMemory | None = None
+_log_returns: np.ndarray | None = None
+
+
+def _attach_log_returns(name: str, size: int) -> None:
+    """Pool initializer: maps the shared log-return buffer into the worker."""
+    global _log_returns, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    _log_returns = np.ndarray((size,), dtype=np.float64, buffer=_shm.buf)
+
+
+def _shard_counts(
+    log_returns: np.ndarray,
+    dte: int,
+    n_paths: int,
+    seed: np.random.SeedSequence,
+    n_bins: int,
+    table: AliasTable | None,
+    memory_budget: int,
+) -> np.ndarray:
+    """Histogram counts of one shard of paths, drawn from its own stream."""
+    sketch = QuantileHistogram(log_returns, dte, n_bins=n_bins)
+    _fill_histogram(
+        sketch,
+        log_returns.astype(np.float32),
+        n_paths,
+        np.random.default_rng(seed),
+        memory_budget,
+        table=table,
+    )
+    return sketch.counts
+
+
+def _shared_shard_counts(*args) -> np.ndarray:
+    """`_shard_counts` of the log returns in shared memory (in a worker)."""
+    return _shard_counts(_log_returns, *args)
+
+
+def parallel_bands(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 1_000_000,
+    seed: int | None = None,
+    n_shards: int = 64,
+    max_workers: int | None = None,
+    memory_budget: int = 64 * 2**20,
+    n_bins: int = 4096,
+    weights: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Streaming bands with the paths split into `n_shards` shards on a process
+    pool.
+
+    The shards do not depend on the number of workers: shard `i` always
+    draws the same number of paths from the `i`-th child of
+    `SeedSequence(seed)`, and the integer histogram counts of the shards are
+    summed. The bands of a seed are therefore bit-identical for any
+    `max_workers`. The log returns are shared with the workers through
+    shared memory, and `memory_budget` is split between the workers.
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    sketch = QuantileHistogram(log_returns, dte, n_bins=n_bins)
+
+    sizes = np.full(n_shards, n_samples // n_shards)
+    sizes[: n_samples % n_shards] += 1
+    table = None if weights is None else AliasTable(weights)
+    shards = [
+        (dte, int(n), child, n_bins, table)
+        for n, child in zip(sizes, np.random.SeedSequence(seed).spawn(n_shards))
+    ]
+    max_workers = min(max_workers or os.cpu_count(), n_shards)
+
+    if max_workers == 1:
+        for shard in shards:
+            sketch.counts += _shard_counts(log_returns, *shard, memory_budget)
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=log_returns.nbytes)
+        try:
+            shared = np.ndarray(log_returns.shape, dtype=np.float64, buffer=shm.buf)
+            shared[:] = log_returns
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_attach_log_returns,
+                initargs=(shm.name, len(log_returns)),
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        _shared_shard_counts, *shard, memory_budget // max_workers
+                    )
+                    for shard in shards
+                ]
+                for future in futures:
+                    sketch.counts += future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    with trace.span("quantiles"):
+        return np.expm1(sketch.quantile(p_itm)), np.expm1(sketch.quantile(1 - p_itm))
+
+
+def fft_bands(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    bins_per_std: int = 32,
+    n_sigma: float = 12.0,
+    memory_budget: int = 64 * 2**20,
+    weights: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Deterministic bands without sampling: the distribution of the h-day log
+    return of an i.i.d. bootstrap is the h-fold convolution of the empirical
+    daily distribution, which is computed as a power of its Fourier transform.
+
+    The centered daily log returns are put on a grid with spacing
+    `std / bins_per_std`, the grid covers `n_sigma` standard deviations of the
+    `dte`-day return (and at least twice the daily support) so that the
+    circular convolution does not wrap around. `weights` give the
+    probability of every return in the daily distribution.
+    """
+    log_returns = np.log1p(np.asarray(returns, dtype=np.float64))
+    if weights is None:
+        weights = np.ones_like(log_returns)
+    weights = np.asarray(weights, dtype=np.float64) / np.sum(weights)
+    mean = np.average(log_returns, weights=weights)
+    std = np.sqrt(np.average((log_returns - mean) ** 2, weights=weights))
+    dx = max(std, 1e-12) / bins_per_std
+
+    grid_index = np.rint((log_returns - mean) / dx).astype(np.int64)
+    # drift per day, including the bias introduced by rounding to the grid
+    drift = mean + np.average(log_returns - mean - grid_index * dx, weights=weights)
+
+    half_width = max(
+        n_sigma * bins_per_std * np.sqrt(dte), 2 * np.abs(grid_index).max()
+    )
+    n_grid = 1 << int(np.ceil(np.log2(2 * half_width + 1)))
+    pmf = np.bincount(grid_index % n_grid, weights=weights, minlength=n_grid)
+    transform = np.fft.rfft(pmf)
+
+    # left edges of the grid cells in fftshift order, plus the right end
+    edges = (np.arange(-(n_grid // 2), n_grid // 2 + 1) - 0.5) * dx
+
+    horizons = np.arange(1, dte + 1)
+    lower_bound, upper_bound = np.empty(dte), np.empty(dte)
+    batch_size = max(1, memory_budget // (16 * len(transform)))
+    for start in range(0, dte, batch_size):
+        batch = horizons[start : start + batch_size]
+        densities = np.fft.irfft(transform[None, :] ** batch[:, None], n=n_grid)
+        densities = np.fft.fftshift(np.clip(densities, 0, None), axes=1)
+        cdfs = np.cumsum(densities, axis=1)
+        cdfs /= cdfs[:, -1:]
+
+        for i, (h, cdf) in enumerate(zip(batch, cdfs), start=start):
+            cdf = np.concatenate([[0.0], cdf])
+            lower_bound[i] = np.interp(p_itm, cdf, edges) + h * drift
+            upper_bound[i] = np.interp(1 - p_itm, cdf, edges) + h * drift
+
+    return np.expm1(lower_bound), np.expm1(upper_bound)
+
+
+def cross_check(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    n_samples: int = 1_000_000,
+    seed: int | None = 0,
+    tolerance: float = 2e-3,
+) -> float:
+    """
+    Compares the FFT engine with the streaming sampler and warns if the bands
+    differ by more than `tolerance` (in return units) on any horizon.
+
+    Returns:
+        float: Largest absolute difference between the two engines.
+    """
+    lower_fft, upper_fft = fft_bands(returns, dte, p_itm)
+    lower_mc, upper_mc = streaming_bands(
+        returns, dte, p_itm, n_samples=n_samples, seed=seed
+    )
+    difference = max(
+        np.abs(lower_fft - lower_mc).max(), np.abs(upper_fft - upper_mc).max()
+    )
+
+    if difference > tolerance:
+        log.warning(
+            f"FFT and Monte Carlo bands differ by {difference:.4f} (> {tolerance})"
+        )
+    else:
+        log.info(f"FFT and Monte Carlo bands agree (max difference {difference:.4f})")
+
+    return difference
+
+
+def expected_move_bands(
+    returns: np.ndarray,
+    dte: int,
+    p_itm: float,
+    engine: Engine = "bootstrap",
+    n_samples: int = 100_000,
+    seed: int | None = None,
+    sampler: Sampler = "plain",
+    target_error: float | None = None,
+    max_workers: int | None = None,
+    weights: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lower and upper expected-move bands for every horizon up to `dte`.
+
+    Args:
+        returns (np.ndarray): Daily simple returns to resample from.
+        dte (int): Days to expiration.
+        p_itm (float): Probability of ending below the lower (above the upper) band.
+        engine (Engine): "bootstrap" keeps all paths in memory,
+            "streaming" generates them in chunks with flat memory usage,
+            "parallel" streams them on a process pool (reproducible for any
+            number of workers),
+            "fft" computes the bands analytically (no sampling noise).
+        n_samples (int): Number of simulated paths.
+        seed (int | None): Seed for the random generator.
+        sampler (Sampler): Variance reduction for the "bootstrap" engine, the
+            other engines raise a ValueError for anything but "plain".
+        target_error (float | None): If set, the "bootstrap" engine picks the
+            number of paths so that the standard error stays below it (other
+            engines raise a ValueError).
+        max_workers (int | None): Processes of the "parallel" engine
+            (default: all cores).
+        weights (np.ndarray | None): Sampling weight per return (see
+            `return_weights`), uniform if None.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Lower and upper band as simple returns.
+    """
+    check_engine(engine, sampler, target_error)
+    if engine == "bootstrap" and (
+        sampler != "plain" or target_error is not None or weights is not None
+    ):
+        if target_error is None:
+            bands = estimate_bands(
+                returns,
+                dte,
+                p_itm,
+                n_samples=n_samples,
+                sampler=sampler,
+                seed=seed,
+                weights=weights,
+            )
+        else:
+            bands = bands_to_target_error(
+                returns,
+                dte,
+                p_itm,
+                target_error,
+                sampler=sampler,
+                seed=seed,
+                weights=weights,
+            )
+        log.info(
+            f"{sampler} sampler with {bands.n_samples} paths: standard error "
+            f"{bands.lower_error[-1]:.5f} (lower), {bands.upper_error[-1]:.5f} (upper)"
+        )
+        return bands.lower, bands.upper
+    if engine == "bootstrap":
+        return bootstrap_bands(returns, dte, p_itm, n_samples=n_samples, seed=seed)
+    if engine == "streaming":
+        return streaming_bands(
+            returns, dte, p_itm, n_samples=n_samples, seed=seed, weights=weights
+        )
+    if engine == "parallel":
+        return parallel_bands(
+            returns,
+            dte,
+            p_itm,
+            n_samples=n_samples,
+            seed=seed,
+            max_workers=max_workers,
+            weights=weights,
+        )
+    if engine == "fft":
+        return fft_bands(returns, dte, p_itm, weights=weights)
+    raise ValueError(f"Unknown engine: {engine}")
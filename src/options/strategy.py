@@ -0,0 +1,302 @@
+"""
+Short-put strategy backtest over a universe of tickers.
+
+On every entry date (cutoff) of every ticker, one put is sold at the
+bootstrapped lower band for `DTE` days and held to expiration. The premium
+comes from Black-Scholes with the trailing realized volatility, so the
+backtest runs offline. Strikes are simulated per ticker on a process pool
+(all cutoffs of a ticker in one batched pass, closes in shared memory);
+pricing, settlement and the portfolio curves are vectorized over all
+trades of the universe at once.
+"""
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from options.reliability import simulate_bounds
+from options.simulation import trailing_volatility
+from utils import trace
+from utils.config import load_config
+from utils.data import get_histories
+from utils.log import log
+
+CONTRACT_SIZE = 100
+TRADING_DAYS = 252
+
+# set in each worker by `_attach_closes`
+_shm: shared_memory.SharedMemory | None = None
+_closes: np.ndarray | None = None
+
+
+def _attach_closes(name: str, size: int) -> None:
+    """Pool initializer: maps the shared close buffer into the worker."""
+    global _closes, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    _closes = np.ndarray((size,), dtype=np.float64, buffer=_shm.buf)
+
+
+def ticker_seed(seed: int | None, ticker: str) -> int | None:
+    """
+    Seed of one ticker, so its trades do not depend on the rest of the
+    universe and tickers do not share random streams.
+    """
+    if seed is None:
+        return None
+    sequence = np.random.SeedSequence([seed, zlib.crc32(ticker.encode())])
+    return int(sequence.generate_state(1)[0])
+
+
+def cutoffs(n_days: int, dte: int) -> np.ndarray:
+    """Entry days: from the first fifth of the history to `dte` days before its end."""
+    return np.arange(n_days // 5, n_days - dte)
+
+
+def _strikes(
+    offset: int, length: int, dte: int, p_itm: float, seed: int | None, **kwargs
+) -> np.ndarray:
+    """Lower band of every cutoff of one ticker (see `cutoffs`)."""
+    close = _closes[offset : offset + length]
+    returns = np.concatenate([[0.0], close[1:] / close[:-1] - 1])
+    lower, _ = simulate_bounds(
+        returns, close, cutoffs(length, dte), dte, p_itm, seed=seed, **kwargs
+    )
+    return lower
+
+
+def put_price(
+    spot: np.ndarray,
+    strike: np.ndarray,
+    volatility: np.ndarray,
+    years: float,
+    rate: float = 0.0,
+) -> np.ndarray:
+    """Black-Scholes price of a European put (per share)."""
+    from scipy.special import ndtr
+
+    scale = volatility * np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * volatility**2) * years) / scale
+    d2 = d1 - scale
+    return strike * np.exp(-rate * years) * ndtr(-d2) - spot * ndtr(-d1)
+
+
+def simulate_trades(
+    closes: dict[str, pd.Series],
+    dte: int,
+    p_itm: float,
+    n_samples: int = 2_500,
+    seed: int | None = None,
+    sampler: str = "plain",
+    weighting: str = "uniform",
+    halflife: float = 250.0,
+    vol_window: int = 21,
+    rate: float = 0.0,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """
+    Sells one put per ticker and entry date and settles it at expiration.
+
+    Args:
+        closes (dict[str, pd.Series]): Daily closes per ticker.
+        dte (int): Trading days from entry to expiration.
+        p_itm (float): Quantile of the bootstrapped price that sets the strike.
+        n_samples (int): Bootstrapped paths per entry date.
+        seed (int | None): Seed of the strikes, see `ticker_seed`.
+        sampler (str): Variance reduction, see `options.simulation.uniforms`.
+        weighting (str): Return weighting, see `options.simulation.return_weights`.
+        halflife (float): Halflife in days of the "exponential" weighting.
+        vol_window (int): Days of the realized volatility used for the premium.
+        rate (float): Risk-free rate of the premium.
+        max_workers (int | None): Size of the process pool (default: all cores).
+
+    Returns:
+        pd.DataFrame: One row per trade with strike, premium, settlement,
+            assignment, P&L and collateral (per contract).
+    """
+    closes = {t: c for t, c in closes.items() if len(c) // 5 < len(c) - dte}
+    offsets = np.cumsum([0] + [len(c) for c in closes.values()])
+    simulation_kwargs = {
+        "n_samples": n_samples,
+        "sampler": sampler,
+        "weighting": weighting,
+        "halflife": halflife,
+    }
+
+    strikes = {}
+    shm = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]) * 8, 1))
+    try:
+        shared = np.ndarray((offsets[-1],), dtype=np.float64, buffer=shm.buf)
+        for offset, c in zip(offsets, closes.values()):
+            shared[offset : offset + len(c)] = c.to_numpy()
+
+        with trace.span("simulate", tickers=len(closes)), ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            initializer=_attach_closes,
+            initargs=(shm.name, int(offsets[-1])),
+        ) as pool:
+            futures = {
+                ticker: pool.submit(
+                    _strikes,
+                    int(offset),
+                    len(c),
+                    dte,
+                    p_itm,
+                    ticker_seed(seed, ticker),
+                    **simulation_kwargs,
+                )
+                for ticker, offset, c in zip(closes, offsets, closes.values())
+            }
+            for ticker, future in futures.items():
+                try:
+                    strikes[ticker] = future.result()
+                except Exception as e:
+                    log.warning(f"Could not simulate strikes for {ticker}: {e}")
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # one flat array per column over all trades of the universe
+    frames = []
+    for ticker, strike in strikes.items():
+        close = closes[ticker]
+        entry = cutoffs(len(close), dte)
+        values = close.to_numpy(dtype=np.float64)
+        log_close = np.log(values)
+        volatility = trailing_volatility(
+            np.diff(log_close, prepend=log_close[0]), window=vol_window
+        )
+        frames.append(
+            pd.DataFrame(
+                {
+                    "ticker": ticker,
+                    "entry_date": close.index[entry],
+                    "expiry_date": close.index[entry + dte],
+                    "spot": values[entry],
+                    "strike": strike,
+                    "volatility": volatility[entry] * np.sqrt(TRADING_DAYS),
+                    "settle": values[entry + dte],
+                }
+            )
+        )
+    if not frames:
+        return pd.DataFrame()
+    trades = pd.concat(frames, ignore_index=True)
+
+    premium = put_price(
+        trades["spot"].to_numpy(),
+        trades["strike"].to_numpy(),
+        trades["volatility"].to_numpy(),
+        dte / TRADING_DAYS,
+        rate,
+    )
+    shortfall = np.maximum(trades["strike"] - trades["settle"], 0)
+    trades["premium"] = premium * CONTRACT_SIZE
+    trades["assigned"] = trades["settle"] < trades["strike"]
+    trades["pnl"] = (premium - shortfall) * CONTRACT_SIZE
+    trades["capital"] = trades["strike"] * CONTRACT_SIZE  # cash secured
+    trades["return_on_capital"] = trades["pnl"] / trades["capital"]
+    return trades
+
+
+def portfolio_curve(trades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Daily curve of the strategy over the universe: P&L realized at expiration,
+    its cumulative sum (`equity`), the `drawdown` from the running peak
+    (starting at zero) and the collateral of the open puts (`capital`).
+    """
+    pnl = trades.groupby("expiry_date")["pnl"].sum()
+    # collateral is locked from entry until expiration
+    capital = pd.concat(
+        [
+            trades.groupby("entry_date")["capital"].sum(),
+            -trades.groupby("expiry_date")["capital"].sum(),
+        ]
+    )
+    # clip the rounding residue once all puts have expired
+    capital = capital.groupby(level=0).sum().sort_index().cumsum().clip(lower=0)
+
+    curve = pd.DataFrame({"capital": capital})
+    curve["pnl"] = pnl.reindex(curve.index, fill_value=0.0)
+    curve["equity"] = curve["pnl"].cumsum()
+    # the starting capital (zero P&L) is the first peak
+    curve["drawdown"] = curve["equity"] - curve["equity"].clip(lower=0).cummax()
+    curve.index.name = "date"
+    return curve.reset_index()
+
+
+def summarize(trades: pd.DataFrame) -> pd.DataFrame:
+    """Per ticker trade count, win and assignment rate, P&L and max drawdown."""
+    trades = trades.sort_values(["ticker", "expiry_date"])
+    equity = trades.groupby("ticker")["pnl"].cumsum()
+    drawdown = equity - equity.clip(lower=0).groupby(trades["ticker"]).cummax()
+
+    summary = trades.groupby("ticker").agg(
+        trades=("pnl", "size"),
+        win_rate=("pnl", lambda pnl: (pnl > 0).mean()),
+        assignment_rate=("assigned", "mean"),
+        premium=("premium", "sum"),
+        pnl=("pnl", "sum"),
+        mean_return_on_capital=("return_on_capital", "mean"),
+    )
+    summary["max_drawdown"] = drawdown.groupby(trades["ticker"]).min()
+    return summary.sort_values("pnl", ascending=False).reset_index()
+
+
+def main(
+    config_path: str = "config/backtest.toml",
+    output_dir: str | None = None,
+    **overrides,
+) -> None:
+    """
+    Backtests the short puts of `TICKERS` and writes the trades, the summary
+    per ticker and the portfolio curve to `OUTPUT` as Parquet (the summary
+    also as csv).
+    """
+    config = load_config(config_path, **overrides)
+    output = Path(output_dir or config.get("OUTPUT", "out/backtest"))
+    dte = config.get("DTE", 30)
+
+    histories = get_histories(config.get("TICKERS"), config.get("PERIOD", "5y"))
+    closes = {t: h["Close"].dropna() for t, h in histories.items()}
+    trades = simulate_trades(
+        closes,
+        dte=dte,
+        p_itm=config.get("P_ITM", 0.3),
+        n_samples=config.get("N_SAMPLES", 2_500),
+        seed=config.get("SEED"),
+        sampler=config.get("SAMPLER", "plain"),
+        weighting=config.get("WEIGHTING", "uniform"),
+        halflife=config.get("HALFLIFE", 250),
+        vol_window=config.get("VOL_WINDOW", 21),
+        rate=config.get("RATE", 0.0),
+        max_workers=config.get("WORKERS"),
+    )
+    if trades.empty:
+        log.warning("No ticker has enough history for a trade")
+        return
+
+    summary = summarize(trades)
+    curve = portfolio_curve(trades)
+
+    output.mkdir(parents=True, exist_ok=True)
+    trades.to_parquet(output / "trades.parquet", index=False)
+    summary.to_parquet(output / "summary.parquet", index=False)
+    summary.to_csv(output / "summary.csv", index=False)
+    curve.to_parquet(output / "portfolio.parquet", index=False)
+
+    print(summary.to_string(index=False, float_format="{:.3f}".format))
+    log.info(
+        f"{len(trades)} trades of {len(summary)} tickers: P&L "
+        f"{curve['equity'].iloc[-1]:,.0f}, max drawdown "
+        f"{curve['drawdown'].min():,.0f}, peak capital {curve['capital'].max():,.0f}"
+    )
+    log.info(f"Wrote trades, summary and portfolio curve to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,154 @@
 # %%
-import joblib
+import datetime
+from functools import cached_property, lru_cache
+
+import numpy as np
 import pandas as pd
+import polars as pl
 import toml
-import yfinance as yf
-from pylatex import Command, Document, NoEscape, Section, Subsection, Table, Tabular
-from rich.progress import track
-
+from pylatex import Command, Document, NoEscape
+
+from reporting.build import build_pdf
+from reporting.model import SUM, PageBreak
+from reporting.model import Report as ReportContent
+from reporting.model import Section, Table
+from reporting.render import to_latex, write_report
+from utils import fx
+from utils.data import DividendCache
 from utils.log import log
 
 # %%
-data = toml.load("config/holdings.toml")
-
-df = pd.DataFrame(data["stocks"]["ibkr"])
-yf_tickers = yf.Tickers(df["ticker"].to_list())
-
-# %%
-# yf_tickers.download(period="2y", interval="3mo")
+USE_CACHE = True  # False refetches the dividends of every position
+DIVIDEND_TTL = datetime.timedelta(days=7)
+DIVIDEND_CACHE = DividendCache(ttl=DIVIDEND_TTL)
+
+
+@lru_cache
+def load_holdings(holdings_path: str = "config/holdings.toml") -> dict:
+    """Parses the holdings file once and shares it between all loaders."""
+    return toml.load(holdings_path)
+
+
+def holdings_frame(holdings: dict, portfolios: list[str]) -> pl.DataFrame:
+    """Stock positions of `portfolios` as one frame (`portfolio`, `ticker`, `position`)."""
+    return pl.DataFrame(
+        [
+            {"portfolio": portfolio, **position}
+            for portfolio in portfolios
+            for position in holdings["stocks"][portfolio]
+        ],
+        schema={"portfolio": pl.String, "ticker": pl.String, "position": pl.Float64},
+    )
+
+
+def dividend_frame(dividends: dict[str, pd.Series]) -> pl.DataFrame:
+    """Concatenates dividend histories into one frame (`ticker`, `date`, `dividend`)."""
+    series = list(dividends.values())
+    return pl.DataFrame(
+        {
+            "ticker": np.repeat(list(dividends), [len(s) for s in series]),
+            "date": np.concatenate(
+                [np.empty(0, "datetime64[ns]")]
+                + [s.index.to_numpy("datetime64[ns]") for s in series]
+            ),
+            "dividend": np.concatenate([np.empty(0)] + [s.to_numpy() for s in series]),
+        },
+        schema={"ticker": pl.String, "date": pl.Datetime("ns"), "dividend": pl.Float64},
+    )
+
+
+def dividend_table(
+    holdings: pl.DataFrame,
+    dividends: pl.DataFrame,
+    hardcoded_dividends: dict[str, float],
+    rates: pl.DataFrame | None = None,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Annual dividend and cashflow of every position and the yearly cashflow
+    of every portfolio.
+
+    The annual dividend is the sum of the dividends paid in the last year
+    before the most recent one (the last full year). Tickers without any
+    dividend data fall back to `hardcoded_dividends`, all others without a
+    full year get 0.
+
+    Args:
+        holdings (pl.DataFrame): Output of `holdings_frame`.
+        dividends (pl.DataFrame): Output of `dividend_frame`.
+        hardcoded_dividends (dict[str, float]): Annual dividend by ticker, in
+            the currency the ticker is listed in.
+        rates (pl.DataFrame | None): Exchange rates (`utils.fx.rates`) to
+            convert into USD; past dividends at the rate of their ex-date,
+            hardcoded ones at the latest rate. Nothing is converted if None.
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: Positions with `dividend` and
+            `cashflow` (in the order of `holdings`), and `portfolio` with
+            its total `cashflow`.
+    """
+    overrides = pl.DataFrame(
+        {
+            "ticker": list(hardcoded_dividends),
+            "hardcoded": list(hardcoded_dividends.values()),
+        },
+        schema={"ticker": pl.String, "hardcoded": pl.Float64},
+    )
+    if rates is not None:
+        dividends = fx.convert(
+            fx.with_currency(dividends), ["dividend"], rates, date="date"
+        )
+        overrides = fx.convert(fx.with_currency(overrides), ["hardcoded"], rates)
+
+    per_ticker = (
+        dividends.lazy()
+        .group_by("ticker", pl.col("date").dt.year().alias("year"))
+        .agg(pl.col("dividend").sum())
+        .group_by("ticker")
+        .agg(
+            pl.len().alias("years"),
+            pl.col("dividend")
+            .sort_by("year", descending=True)
+            .slice(1, 1)
+            .first()
+            .alias("last_full_year"),
+        )
+    )
+    positions = (
+        holdings.lazy()
+        .join(per_ticker, on="ticker", how="left", maintain_order="left")
+        .join(
+            overrides.lazy().select("ticker", "hardcoded"),
+            on="ticker",
+            how="left",
+            maintain_order="left",
+        )
+        .with_columns(
+            dividend=pl.when(pl.col("years").is_null())
+            .then(pl.col("hardcoded"))
+            .otherwise(pl.col("last_full_year"))
+            .fill_null(0.0)
+        )
+        .with_columns(cashflow=pl.col("position") * pl.col("dividend"))
+    )
+    totals = positions.group_by("portfolio", maintain_order=True).agg(
+        pl.col("cashflow").sum()
+    )
+    positions, totals = pl.collect_all([positions, totals])
+
+    missing = positions.filter(
+        pl.col("years").is_null() & pl.col("hardcoded").is_null()
+    )
+    for ticker in missing["ticker"].unique(maintain_order=True):
+        log.warning(f"No data found for {ticker}")
+    for ticker in positions.filter(pl.col("years") == 1)["ticker"].unique(
+        maintain_order=True
+    ):
+        log.warning(f"No full year of dividends for ticker {ticker}.")
 
-# %%
-USE_CACHE = False
+    return (
+        positions.select("portfolio", "ticker", "position", "dividend", "cashflow"),
+        totals,
+    )
 
 
 class DataLoader:
@@ -27,8 +157,11 @@ class DataLoader:
         portfolio_name: str = None,
         holdings_path: str = "config/holdings.toml",
     ) -> None:
-        self.data = toml.load(holdings_path)
-        self.HARDCODED_DIVIDENDS = self.data["hardcoded_dividends"]
+        self.data = load_holdings(holdings_path)
+        self.HARDCODED_DIVIDENDS = {
+            elem["ticker"]: elem["dividend"]
+            for elem in self.data["hardcoded_dividends"]
+        }
 
         if portfolio_name is not None:
             self.portfolio_name = portfolio_name
@@ -36,66 +169,33 @@ class DataLoader:
             self.position = {
                 elem.get("ticker"): elem.get("position") for elem in self.portfolio
             }
-            ticker_list = [el.get("ticker") for el in self.portfolio]
-            self.yf_tickers = yf.Tickers(ticker_list)
-
-    def _get_avg_historical_dividend(self, yf_ticker: yf.Ticker):
-        """
-        Pulls average yearly dividend for yf_ticker.
-
-        Args:
-            yf_ticker (yf.Ticker): yfinance ticker object
-
-        Returns:
-            float: Average yearly dividend of current and previous year.
-        """
-        dividends = yf_ticker.dividends
-        if len(dividends) == 0:
-            for elem in self.HARDCODED_DIVIDENDS:
-                if elem["ticker"] == yf_ticker.ticker:
-                    return elem["dividend"]
-
-            log.warning(f"No data found for {yf_ticker.ticker}")
-            return 0.0
-        dividends = dividends.to_frame().reset_index()
+            self.tickers = [el.get("ticker") for el in self.portfolio]
 
-        dividend_per_year = dividends.groupby(dividends["Date"].dt.year)["Dividends"].sum()
-
-        if dividend_per_year.empty:
-            log.warning(
-                f"Dataframe of avg dividend per year is empty for ticker {yf_ticker.ticker}."
-            )
-            return 0.0
-
-        try:
-            # use average of last 2 full years
-            return dividend_per_year.iloc[-2]
-        except:
-            log.warning(
-                f"Could not index previous years dividend for ticker {yf_ticker.ticker}."
-            )
-            return 0.0
-
-    def create_dividends_list(self, use_cache: bool = True):
-        if use_cache:
-            log.info("Using cached information.")
-            return joblib.load(f"out/cache/dividends_{self.portfolio_name}.joblib")
-
-        dividends = []
-        for ticker in track(self.yf_tickers.tickers.values()):
-            dividend = self._get_avg_historical_dividend(ticker)
-            dividends.append(
-                {
-                    "ticker": ticker.ticker,
-                    "dividend": dividend,
-                    "position": self.position.get(ticker.ticker),
-                    "cashflow": self.position.get(ticker.ticker) * dividend,
-                }
-            )
-
-        joblib.dump(dividends, f"out/cache/dividends_{self.portfolio_name}.joblib")
+    def dividend_table(
+        self,
+        portfolios: list[str],
+        use_cache: bool = True,
+        rates: pl.DataFrame | None = None,
+    ) -> tuple[pl.DataFrame, pl.DataFrame]:
+        """`dividend_table` of `portfolios`, fetching the expired tickers of all of them at once."""
+        holdings = holdings_frame(self.data, portfolios)
+        # only expired tickers are refetched, everything if `use_cache` is False
+        dividend_history = DIVIDEND_CACHE.get(
+            holdings["ticker"].unique(maintain_order=True).to_list(),
+            force=not use_cache,
+        )
+        return dividend_table(
+            holdings,
+            dividend_frame(dividend_history),
+            self.HARDCODED_DIVIDENDS,
+            rates=rates,
+        )
 
-        return dividends
+    def create_dividends_list(
+        self, use_cache: bool = True, rates: pl.DataFrame | None = None
+    ):
+        positions, _ = self.dividend_table([self.portfolio_name], use_cache, rates)
+        return positions.drop("portfolio").to_dicts()
 
     def get_crypto_data(self):
         return self.data["crypto"]["positions"]
@@ -105,14 +205,31 @@ class DataLoader:
 
 
 class Report:
-    def __init__(self) -> None:
-        self.eurusd = yf.Ticker("EURUSD=X").history("1d").to_numpy().ravel()[0]
+    def __init__(
+        self, use_cache: bool = USE_CACHE, holdings_path: str = "config/holdings.toml"
+    ) -> None:
         self.PORTFOLIOS = ["ibkr", "degiro", "comdirect"]
+        self.use_cache = use_cache
+        self.holdings_path = holdings_path
+
+        # daily rates of every currency in the book, served from the price store
+        loader = DataLoader(holdings_path=holdings_path)
+        currencies = {"EUR"} | {
+            fx.currency_of(position["ticker"])
+            for portfolio in self.PORTFOLIOS
+            for position in loader.data["stocks"][portfolio]
+        }
+        currencies |= {
+            position["currency"]
+            for position in loader.get_p2p_data() + loader.get_crypto_data()
+            if "currency" in position
+        }
+        self.rates = fx.rates(currencies)
+        self.eurusd = fx.latest_rates(self.rates)["EUR"]
 
     def create_preamble(self, doc: Document):
         doc.preamble.append(Command("usepackage", "charter"))
         doc.preamble.append(Command("usepackage", "parskip"))
-        doc.preamble.append(Command("usepackage", "booktabs"))
         # doc.preamble.append(Command("usepackage", "float"))
         doc.preamble.append(
             Command("usepackage", "geometry", ["a4paper", "margin=1in"])
@@ -122,195 +239,212 @@ class Report:
         doc.append(Command("date", NoEscape("\\vspace{-3em}\\today")))
         doc.append(Command("maketitle"))
 
-    def create_table_from_dividends(self, doc: Document, dividends: list):
-        with doc.create(Table(position="!ht")) as t:
-            t.append(Command("centering"))
-
-            with t.create(Tabular(table_spec="lcccc", booktabs=False)) as tab:
-                tab.append(Command("toprule"))
-                tab.add_row(
-                    [
-                        Command("textbf", "Ticker"),
-                        Command("textbf", "Annual Dividend"),
-                        Command("textbf", "Position"),
-                        Command("textbf", "Yearly Cashflow"),
-                        Command("textbf", "Monthly Cashflow"),
-                    ]
-                )
-                tab.append(Command("midrule"))
-
-                for elem in dividends:
-                    tab.add_row(
-                        [
-                            elem["ticker"],
-                            f"${elem['dividend']:7.2f}",
-                            elem["position"],
-                            f"${elem['cashflow']:7.2f}",
-                            f"${elem['cashflow'] / 12:7.2f}",
-                        ]
-                    )
-
-                tab.append(Command("midrule"))
-                total_yearly = sum(elem["cashflow"] for elem in dividends)
-                tab.add_row(
-                    [
-                        NoEscape("$\Sigma$"),
-                        "-",
-                        "-",
-                        f"${total_yearly:7.2f}",
-                        f"${total_yearly/12:7.2f}",
-                    ]
-                )
-                tab.append(Command("bottomrule"))
+    def create_table_from_dividends(self, dividends: list) -> Table:
+        total_yearly = sum(elem["cashflow"] for elem in dividends)
+        return Table(
+            header=[
+                "Ticker",
+                "Annual Dividend",
+                "Position",
+                "Yearly Cashflow",
+                "Monthly Cashflow",
+            ],
+            rows=[
+                [
+                    elem["ticker"],
+                    f"${elem['dividend']:7.2f}",
+                    f"{elem['position']:g}",
+                    f"${elem['cashflow']:7.2f}",
+                    f"${elem['cashflow'] / 12:7.2f}",
+                ]
+                for elem in dividends
+            ],
+            totals=[
+                [SUM, "-", "-", f"${total_yearly:7.2f}", f"${total_yearly/12:7.2f}"]
+            ],
+            align="lcccc",
+        )
 
-    def add_summary_section(self, doc: Document):
-        doc.append(Section("Summary"))
+    @cached_property
+    def dividends(self) -> tuple[pl.DataFrame, pl.DataFrame]:
+        """Positions and yearly cashflow per portfolio (see `dividend_table`)."""
+        loader = DataLoader(holdings_path=self.holdings_path)
+        return loader.dividend_table(
+            self.PORTFOLIOS, use_cache=self.use_cache, rates=self.rates
+        )
 
-        cash_flows = dict()  # map: portfolioname -> yearly CF
-        for portfolio in self.PORTFOLIOS:
-            dividends = DataLoader(portfolio).create_dividends_list(use_cache=USE_CACHE)
-            cash_flows[portfolio] = sum(ele["cashflow"] for ele in dividends)
+    def summary_section(self) -> Section:
+        _, totals = self.dividends
+        cash_flows = dict(totals.iter_rows())  # map: portfolioname -> yearly CF
 
-        cash_flows["p2p"] = sum(
-            [
-                pos["investment"] * self.eurusd * pos["apr"]
-                for pos in DataLoader().get_p2p_data()
-            ]
-        )
+        p2p = DataLoader(holdings_path=self.holdings_path).get_p2p_data()
+        cash_flows["p2p"] = self.other_investments(p2p, "EUR")["cashflow"].sum()
 
         # cash_flows["crypto"] = sum(
         #     [pos["investment"] * pos["apr"] for pos in DataLoader().get_crypto_data()]
         # )
 
-        with doc.create(Table(position="!ht")) as t:
-            t.append(Command("centering"))
-
-            with t.create(Tabular(table_spec="lccc", booktabs=False)) as tab:
-                tab.append(Command("toprule"))
-                tab.add_row(
-                    [
-                        Command("textbf", "Currency"),
-                        Command("textbf", "Yearly Cashflow"),
-                        Command("textbf", "Monthly Cashflow"),
-                        Command("textbf", "Daily Cashflow"),
-                    ]
-                )
-                tab.append(Command("midrule"))
+        yearly_cf = sum(cash_flows.values())
+        disclaimer = f"EUR/USD rate = {self.eurusd:.3f}, summing cashflow from {', '.join(cash_flows.keys())}"
+
+        table = Table(
+            header=[
+                "Currency",
+                "Yearly Cashflow",
+                "Monthly Cashflow",
+                "Daily Cashflow",
+            ],
+            rows=[
+                [
+                    "USD",
+                    f"${yearly_cf:8.2f}",
+                    f"${yearly_cf / 12:8.2f}",
+                    f"${yearly_cf/12/31:8.2f}",
+                ],
+                [
+                    "EUR",
+                    f"€{1/self.eurusd * yearly_cf:8.2f}",
+                    f"€{1/self.eurusd * yearly_cf / 12:8.2f}",
+                    f"€{1/self.eurusd * yearly_cf/12/31:8.2f}",
+                ],
+            ],
+            note=disclaimer,
+            align="lccc",
+        )
+        return Section("Summary", [table])
 
-                yearly_cf = sum(cash_flows.values())
+    def stocks_section(self) -> Section:
+        # blocks.append(PageBreak())
+        PAGEBREAK_AFTER = ["ibkr", "comdirect"]
+        blocks = []
 
-                tab.add_row(
-                    [
-                        "USD",
-                        f"${yearly_cf:8.2f}",
-                        f"${yearly_cf / 12:8.2f}",
-                        f"${yearly_cf/12/31:8.2f}",
-                    ]
-                )
+        positions, _ = self.dividends
+        for portfolio in self.PORTFOLIOS:
+            dividends = (
+                positions.filter(pl.col("portfolio") == portfolio)
+                .sort("cashflow", descending=True, maintain_order=True)
+                .to_dicts()
+            )
 
-                tab.add_row(
-                    [
-                        "EUR",
-                        f"€{1/self.eurusd * yearly_cf:8.2f}",
-                        f"€{1/self.eurusd * yearly_cf / 12:8.2f}",
-                        f"€{1/self.eurusd * yearly_cf/12/31:8.2f}",
-                    ]
-                )
-                tab.append(Command("bottomrule"))
-
-                disclaimer = f"EUR/USD rate = {self.eurusd:.3f}, summing cashflow from {', '.join(cash_flows.keys())}"
-                tab.append(
-                    Command(
-                        "multicolumn",
-                        [4, "c", NoEscape(f"\\footnotesize {disclaimer}")],
-                    )
+            blocks.append(
+                Section(
+                    f"Portfolio: {portfolio.upper()}",
+                    [self.create_table_from_dividends(dividends)],
+                    level=2,
                 )
+            )
 
-    def add_stocks_section(self, doc: Document):
-        # doc.append(Command("newpage"))
-        PAGEBREAK_AFTER = ["ibkr", "comdirect"]
-        doc.append(Section("Stocks and Equities"))
+            if portfolio in PAGEBREAK_AFTER:
+                blocks.append(PageBreak())
 
-        for portfolio in self.PORTFOLIOS:
-            dl = DataLoader(portfolio)
-            dividends = dl.create_dividends_list(use_cache=True)
-            dividends.sort(key=lambda e: e["cashflow"] * -1)
+        return Section("Stocks and Equities", blocks)
 
-            doc.append(Subsection(f"Portfolio: {portfolio.upper()}"))
-            self.create_table_from_dividends(doc, dividends)
+    def other_investments(self, data: list, currency: str) -> pl.DataFrame:
+        """
+        Positions with their investment converted into USD and their yearly
+        cashflow, largest cashflow first.
 
-            if portfolio in PAGEBREAK_AFTER:
-                doc.append(Command("newpage"))
+        Args:
+            data (list): Positions with `platform`, `investment` and `apr`.
+            currency (str): Currency of positions without a `currency` key.
+        """
+        positions = pl.DataFrame(
+            [{"currency": currency, **position} for position in data],
+            schema={
+                "platform": pl.String,
+                "investment": pl.Float64,
+                "apr": pl.Float64,
+                "currency": pl.String,
+            },
+        )
+        return (
+            fx.convert(positions, ["investment"], self.rates)
+            .with_columns(cashflow=pl.col("investment") * pl.col("apr"))
+            .sort("cashflow", descending=True, maintain_order=True)
+        )
 
-    def create_table_for_other_investment(
-        self, doc: Document, data: list, convert_eur_to_usd: bool
-    ):
-        data.sort(key=lambda x: x["investment"] * x["apr"] * -1)
-
-        all_cashflows = []
-        with doc.create(Table(position="!ht")) as t:
-            t.append(Command("centering"))
-
-            with t.create(Tabular(table_spec="lcccc", booktabs=False)) as tab:
-                tab.append(Command("toprule"))
-                tab.add_row(
-                    [
-                        Command("textbf", "Platform"),
-                        Command("textbf", "Investment"),
-                        Command("textbf", "APR"),
-                        Command("textbf", "Yearly Cashflow"),
-                        Command("textbf", "Monthly Cashflow"),
-                    ]
-                )
-                tab.append(Command("midrule"))
-
-                currency_conversion = self.eurusd if convert_eur_to_usd else 1.0
-
-                for position in data:
-                    investment = position["investment"] * currency_conversion
-                    apr = position["apr"]
-                    cashflow = investment * apr
-                    all_cashflows.append(cashflow)
-                    tab.add_row(
-                        [
-                            position["platform"],
-                            f"${investment:7.2f}",
-                            f"{apr:.1%}",
-                            f"${cashflow:7.2f}",
-                            f"${cashflow / 12:7.2f}",
-                        ]
-                    )
-            tab.append(Command("midrule"))
-            tab.add_row(
+    def create_table_for_other_investment(self, data: list, currency: str) -> Table:
+        positions = self.other_investments(data, currency)
+        all_cashflows = positions["cashflow"].to_list()
+        rows = [
+            [
+                position["platform"],
+                f"${position['investment']:7.2f}",
+                f"{position['apr']:.1%}",
+                f"${position['cashflow']:7.2f}",
+                f"${position['cashflow'] / 12:7.2f}",
+            ]
+            for position in positions.iter_rows(named=True)
+        ]
+
+        return Table(
+            header=[
+                "Platform",
+                "Investment",
+                "APR",
+                "Yearly Cashflow",
+                "Monthly Cashflow",
+            ],
+            rows=rows,
+            totals=[
                 [
-                    NoEscape("$\Sigma$"),
+                    SUM,
                     "-",
                     "-",
                     f"${sum(all_cashflows):7.2f}",
                     f"${sum(all_cashflows)/12:7.2f}",
                 ]
-            )
-            tab.append(Command("bottomrule"))
+            ],
+            align="lcccc",
+        )
 
-    def add_p2p_section(self, doc: Document):
-        doc.append(Section("P2P Lending"))
-        data = DataLoader().get_p2p_data()
-        self.create_table_for_other_investment(doc, data=data, convert_eur_to_usd=True)
+    def p2p_section(self) -> Section:
+        data = DataLoader(holdings_path=self.holdings_path).get_p2p_data()
+        table = self.create_table_for_other_investment(data, currency="EUR")
+        return Section("P2P Lending", [table])
 
-    def add_crypto_section(self, doc: Document):
-        doc.append(Section("Crypto Staking"))
-        data = DataLoader().get_crypto_data()
-        self.create_table_for_other_investment(doc, data=data, convert_eur_to_usd=False)
+    def crypto_section(self) -> Section:
+        data = DataLoader(holdings_path=self.holdings_path).get_crypto_data()
+        table = self.create_table_for_other_investment(data, currency="USD")
+        return Section("Crypto Staking", [table])
+
+    def create_report(self) -> ReportContent:
+        return ReportContent(
+            "Passive Income Report",
+            [
+                self.summary_section(),
+                self.stocks_section(),
+                self.p2p_section(),
+                # self.crypto_section(),
+            ],
+        )
+
+    def create(self, force: bool = False, fmt: str = "pdf"):
+        """
+        Builds the report as a PDF, or as a self-contained HTML or Markdown
+        file (`fmt` "html" or "md") that does not need LaTeX.
+        """
+        report = self.create_report()
+        if fmt != "pdf":
+            write_report(report, f"out/report/report.{fmt}")
+            return
 
-    def create(self):
         doc = Document("basic", document_options="8pt")
         self.create_preamble(doc)
-        self.add_summary_section(doc)
-        self.add_stocks_section(doc)
-        self.add_p2p_section(doc)
-        # self.add_crypto_section(doc)
-        doc.generate_pdf("out/report/report", clean_tex=False)
+        to_latex(doc, report.blocks)
+        build_pdf(doc, "out/report/report", force=force, clean_tex=False)
+
+
+def main(
+    holdings_path: str = "config/holdings.toml",
+    use_cache: bool = USE_CACHE,
+    force: bool = False,
+    fmt: str = "pdf",
+):
+    Report(use_cache=use_cache, holdings_path=holdings_path).create(
+        force=force, fmt=fmt
+    )
 
 
-r = Report()
-r.create()
+if __name__ == "__main__":
+    main()
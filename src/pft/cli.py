@@ -0,0 +1,331 @@
+"""
+Command line interface of the personal finance tools.
+
+Subcommand modules (and the heavy libraries they use) are only imported once
+the subcommand runs, so `pft --help` and light commands start quickly.
+"""
+
+import argparse
+import importlib
+
+
+def _shortput_overrides(args: argparse.Namespace) -> dict:
+    return {
+        "TICKER": args.ticker,
+        "DTE": args.dte,
+        "P_ITM": args.p_itm,
+        "PERIOD": args.period,
+        "WEIGHTING": args.weighting,
+        "HALFLIFE": args.halflife,
+    }
+
+
+def _expected_move(args: argparse.Namespace) -> None:
+    from options.expected_move import main
+
+    main(
+        args.config,
+        **_shortput_overrides(args),
+        ENGINE=args.engine,
+        N_SAMPLES=args.samples,
+        SEED=args.seed,
+        SAMPLER=args.sampler,
+        TARGET_ERROR=args.target_error,
+        WORKERS=args.workers,
+    )
+
+
+def _reliability(args: argparse.Namespace) -> None:
+    from options.expected_move_reliability import main
+
+    main(
+        args.config,
+        sweep=args.sweep,
+        **_shortput_overrides(args),
+        THRESH=args.thresh,
+        SEED=args.seed,
+        SAMPLER=args.sampler,
+        TARGET_ERROR=args.target_error,
+        SWEEP_DTES=args.dtes,
+        SWEEP_P_ITMS=args.p_itms,
+    )
+
+
+def _expiries(args: argparse.Namespace) -> None:
+    from options.chain import main
+
+    main(
+        args.config,
+        snapshot=args.snapshot,
+        **_shortput_overrides(args),
+        SAMPLER=args.sampler,
+        SEED=args.seed,
+        CHAIN_P_ITMS=args.p_itms,
+    )
+
+
+def _shortput_report(args: argparse.Namespace) -> None:
+    from reporting.shortput_report import main
+
+    main(
+        args.config,
+        force=args.force,
+        fmt=args.format,
+        **_shortput_overrides(args),
+        TICKERS=args.tickers,
+    )
+
+
+def _backtest(args: argparse.Namespace) -> None:
+    from options.strategy import main
+
+    main(
+        args.config,
+        output_dir=args.output_dir,
+        TICKERS=args.tickers,
+        DTE=args.dte,
+        P_ITM=args.p_itm,
+        PERIOD=args.period,
+        SEED=args.seed,
+        WEIGHTING=args.weighting,
+        WORKERS=args.workers,
+    )
+
+
+def _scan(args: argparse.Namespace) -> None:
+    from options.scanner import main
+
+    main(
+        args.config,
+        sampler=args.sampler,
+        target_error=args.target_error,
+        engine=args.engine,
+    )
+
+
+def _income_report(args: argparse.Namespace) -> None:
+    # the package directory name is not a valid identifier
+    income = importlib.import_module("passive-income.income")
+    income.main(
+        holdings_path=args.holdings,
+        use_cache=not args.no_cache,
+        force=args.force,
+        fmt=args.format,
+    )
+
+
+def _corr(args: argparse.Namespace) -> None:
+    from portfolio.portfolio_corr import main
+
+    main(
+        args.config, period=args.period, window=args.window, output_dir=args.output_dir
+    )
+
+
+def _etf_history(args: argparse.Namespace) -> None:
+    from etfs.portfolio import main
+
+    main(
+        args.tickers or None,
+        reinvest_dividends=args.reinvest_dividends,
+        output_dir=args.output_dir,
+    )
+
+
+def _relative_performance(args: argparse.Namespace) -> None:
+    from portfolio.relative_performance import main
+
+    main(
+        args.tickers or None,
+        period=args.period,
+        output_dir=args.output_dir,
+        streaming=args.streaming,
+    )
+
+
+def _add_shortput_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--config", default="config/shortput.toml")
+    parser.add_argument("--ticker", help="overrides TICKER from the config")
+    parser.add_argument("--dte", type=int, help="overrides DTE from the config")
+    parser.add_argument("--p-itm", type=float, help="overrides P_ITM from the config")
+    parser.add_argument("--period", help="overrides PERIOD from the config")
+    parser.add_argument(
+        "--weighting",
+        choices=["uniform", "exponential", "regime"],
+        help="overrides WEIGHTING (sampling weights of the past returns)",
+    )
+    parser.add_argument(
+        "--halflife", type=float, help="overrides HALFLIFE from the config"
+    )
+
+
+def _add_sampling_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--sampler", choices=["plain", "antithetic", "stratified", "sobol"]
+    )
+    parser.add_argument(
+        "--target-error",
+        type=float,
+        help="standard error of the bands that picks the number of paths",
+    )
+
+
+def _add_output_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--format",
+        choices=["pdf", "html", "md"],
+        default="pdf",
+        help="html and md are self-contained and skip LaTeX",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="recompile even if nothing changed"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pft", description="A toolbox for everything personal finance related"
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="time the stages, write a Chrome trace to PATH and print a summary",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also record the peak memory of every stage (slower)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser(
+        "expected-move", help="plot the expected move of a ticker"
+    )
+    _add_shortput_args(p)
+    _add_sampling_args(p)
+    p.add_argument("--engine", choices=["bootstrap", "streaming", "parallel", "fft"])
+    p.add_argument("--samples", type=int, help="number of simulated paths")
+    p.add_argument("--seed", type=int)
+    p.add_argument("--workers", type=int, help="processes of the parallel engine")
+    p.set_defaults(handler=_expected_move)
+
+    p = subparsers.add_parser(
+        "reliability", help="backtest the historic reliability of the expected move"
+    )
+    _add_shortput_args(p)
+    _add_sampling_args(p)
+    p.add_argument("--thresh", choices=["lower", "upper", "both"])
+    p.add_argument("--seed", type=int)
+    p.add_argument(
+        "--sweep",
+        action="store_true",
+        help="backtest all DTEs, P_ITMs and thresholds at once",
+    )
+    p.add_argument("--dtes", type=int, nargs="+", help="overrides SWEEP_DTES")
+    p.add_argument("--p-itms", type=float, nargs="+", help="overrides SWEEP_P_ITMS")
+    p.set_defaults(handler=_reliability)
+
+    p = subparsers.add_parser(
+        "expiries", help="expected-move strikes for every listed option expiration"
+    )
+    _add_shortput_args(p)
+    p.add_argument("--sampler", choices=["plain", "antithetic", "stratified", "sobol"])
+    p.add_argument("--seed", type=int)
+    p.add_argument("--p-itms", type=float, nargs="+", help="overrides CHAIN_P_ITMS")
+    p.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="download and store the option chain first (needs network)",
+    )
+    p.set_defaults(handler=_expiries)
+
+    p = subparsers.add_parser(
+        "shortput-report",
+        help="build the short put PDF report (bands, backtest and document)",
+    )
+    _add_shortput_args(p)
+    p.add_argument(
+        "--tickers", nargs="+", help="one report per ticker, overrides TICKERS"
+    )
+    _add_output_args(p)
+    p.set_defaults(handler=_shortput_report)
+
+    p = subparsers.add_parser(
+        "backtest", help="backtest selling puts at the lower band over a universe"
+    )
+    p.add_argument("--config", default="config/backtest.toml")
+    p.add_argument("--tickers", nargs="+", help="overrides TICKERS from the config")
+    p.add_argument("--dte", type=int, help="overrides DTE from the config")
+    p.add_argument("--p-itm", type=float, help="overrides P_ITM from the config")
+    p.add_argument("--period", help="overrides PERIOD from the config")
+    p.add_argument("--seed", type=int)
+    p.add_argument("--weighting", choices=["uniform", "exponential", "regime"])
+    p.add_argument("--workers", type=int, help="size of the process pool")
+    p.add_argument("--output-dir", help="overrides OUTPUT from the config")
+    p.set_defaults(handler=_backtest)
+
+    p = subparsers.add_parser("scan", help="expected moves for a watchlist")
+    p.add_argument("--config", default="config/watchlist.toml")
+    _add_sampling_args(p)
+    p.add_argument(
+        "--engine",
+        choices=["bootstrap", "streaming", "parallel", "fft"],
+        help="overrides ENGINE (default with --sampler/--target-error: bootstrap)",
+    )
+    p.set_defaults(handler=_scan)
+
+    p = subparsers.add_parser("income-report", help="build the passive income report")
+    p.add_argument("--holdings", default="config/holdings.toml")
+    p.add_argument("--no-cache", action="store_true", help="refetch all dividend data")
+    _add_output_args(p)
+    p.set_defaults(handler=_income_report)
+
+    p = subparsers.add_parser("corr", help="correlation of portfolio and candidates")
+    p.add_argument("--config", default="config/portfolio.toml")
+    p.add_argument("--period", default="1mo")
+    p.add_argument(
+        "--window", type=int, help="correlate over the last WINDOW days of the period"
+    )
+    p.add_argument("--output-dir", default="out")
+    p.set_defaults(handler=_corr)
+
+    p = subparsers.add_parser("etf-history", help="plot the history of ETFs")
+    p.add_argument("tickers", nargs="*")
+    p.add_argument("--reinvest-dividends", action="store_true")
+    p.add_argument("--output-dir", default="out")
+    p.set_defaults(handler=_etf_history)
+
+    p = subparsers.add_parser(
+        "relative-performance", help="compare the yearly performance of tickers"
+    )
+    p.add_argument("tickers", nargs="*")
+    p.add_argument("--period", default="7y")
+    p.add_argument("--output-dir", default="out")
+    p.add_argument(
+        "--streaming", action="store_true", help="use polars' streaming engine"
+    )
+    p.set_defaults(handler=_relative_performance)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    if args.trace is None and not args.trace_memory:
+        args.handler(args)
+        return
+
+    from utils import trace
+
+    trace.start(memory=args.trace_memory)
+    try:
+        with trace.span(args.command):
+            args.handler(args)
+    finally:
+        tracer = trace.stop()
+        tracer.write(args.trace or "out/trace.json")
+        tracer.print_summary()
+
+
+if __name__ == "__main__":
+    main()
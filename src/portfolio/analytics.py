@@ -0,0 +1,125 @@
+"""
+Performance analytics for many tickers as lazy polars plans.
+
+All functions take and return long-format `LazyFrame`s with one row per date
+and ticker, as produced by `utils.data.scan_prices(..., auto_adjust=False)`.
+Nothing is computed until the plans are collected, so several results can be
+collected together (sharing the scan) and large universes can be collected
+with the streaming engine.
+"""
+
+import polars as pl
+
+from utils import trace
+
+TRADING_DAYS = 252
+
+_by_ticker = {"partition_by": "ticker", "order_by": "date"}
+
+
+def align_start(prices: pl.LazyFrame) -> pl.LazyFrame:
+    """Drops the rows before the first date on which every ticker has a price."""
+    return prices.filter(pl.col("date") >= pl.col("date").min().over("ticker").max())
+
+
+def total_return(prices: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Adds daily total returns and a total-return index to raw prices.
+
+    Dividends are reinvested at the close of their ex-date, so the return of
+    an ex-date is `(close + dividend) / previous close - 1`.
+
+    Args:
+        prices (pl.LazyFrame): `date`, `ticker`, raw (not dividend-adjusted)
+            `close` and `dividends`.
+
+    Returns:
+        pl.LazyFrame: `prices` with `price_index` (without dividends),
+            `daily_return` and `tr_index`, both indices starting at 1.
+    """
+    close = pl.col("close").cast(pl.Float64)
+    daily_return = (close + pl.col("dividends")) / close.shift(1).over(**_by_ticker) - 1
+
+    return prices.with_columns(daily_return=daily_return.fill_null(0.0)).with_columns(
+        price_index=close / close.first().over(**_by_ticker),
+        tr_index=(pl.col("daily_return") + 1).cum_prod().over(**_by_ticker),
+    )
+
+
+def calendar_year_returns(returns: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Total return of every ticker within each calendar year (partial years at
+    the start and end of the history included).
+
+    Args:
+        returns (pl.LazyFrame): Output of `total_return`.
+
+    Returns:
+        pl.LazyFrame: `ticker`, `year` and `return`.
+    """
+    return (
+        returns.group_by("ticker", pl.col("date").dt.year().alias("year"))
+        .agg(((pl.col("daily_return") + 1).product() - 1).alias("return"))
+        .sort("ticker", "year")
+    )
+
+
+def rolling_returns(returns: pl.LazyFrame, window: int) -> pl.LazyFrame:
+    """
+    Adds the total return over the last `window` trading days
+    (`rolling_return`, null for the first `window` days of every ticker).
+    """
+    tr_index = pl.col("tr_index")
+    return returns.with_columns(
+        rolling_return=tr_index / tr_index.shift(window).over(**_by_ticker) - 1
+    )
+
+
+def drawdown(returns: pl.LazyFrame) -> pl.LazyFrame:
+    """Adds the decline of the total-return index from its running peak."""
+    tr_index = pl.col("tr_index")
+    return returns.with_columns(
+        drawdown=tr_index / tr_index.cum_max().over(**_by_ticker) - 1
+    )
+
+
+def summary(returns: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Per ticker total return, annualized return and volatility (from daily
+    returns) and max drawdown of the total-return index.
+
+    Args:
+        returns (pl.LazyFrame): Output of `total_return`.
+    """
+    # rows within a group are not guaranteed to be in date order when streaming
+    years = (pl.col("date").max() - pl.col("date").min()).dt.total_days() / 365.25
+    tr_index = pl.col("tr_index").sort_by("date")
+    total = tr_index.last() / tr_index.first() - 1
+
+    return (
+        drawdown(returns)
+        .group_by("ticker")
+        .agg(
+            pl.col("date").min().alias("start"),
+            pl.col("date").max().alias("end"),
+            total.alias("total_return"),
+            ((total + 1) ** (1 / years) - 1).alias("cagr"),
+            (pl.col("daily_return").std() * TRADING_DAYS**0.5).alias("volatility"),
+            pl.col("drawdown").min().alias("max_drawdown"),
+        )
+        .sort("ticker")
+    )
+
+
+def collect(*plans: pl.LazyFrame, streaming: bool = False) -> list[pl.DataFrame]:
+    """
+    Collects several plans at once, so work they share (e.g. the scan and the
+    total returns) is done only once.
+
+    Args:
+        *plans (pl.LazyFrame): Plans to compute.
+        streaming (bool): Use the streaming engine, which processes the data in
+            batches for inputs that do not fit into memory.
+    """
+    with trace.span("collect", plans=len(plans), streaming=streaming):
+        return pl.collect_all(plans, engine="streaming" if streaming else "auto")
@@ -0,0 +1,150 @@
+"""
+Incremental correlation between two groups of return series.
+
+Only the block between the rows (e.g. portfolio holdings) and the columns
+(e.g. candidates) is computed, from running sums that are updated in
+O(rows * columns) per day. Missing values are skipped pairwise, like
+`pd.DataFrame.corr` does.
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class RollingCorrelation:
+    def __init__(self, n_rows: int, n_cols: int, window: int | None = None) -> None:
+        """
+        Args:
+            n_rows (int): Number of series in the first group.
+            n_cols (int): Number of series in the second group.
+            window (int | None): Number of most recent days to correlate over,
+                all days if None.
+        """
+        self.window = window
+        self._days = deque()
+
+        shape = (n_rows, n_cols)
+        self.n = np.zeros(shape)
+        self.sum_x = np.zeros(shape)
+        self.sum_y = np.zeros(shape)
+        self.sum_xx = np.zeros(shape)
+        self.sum_yy = np.zeros(shape)
+        self.sum_xy = np.zeros(shape)
+
+    def _add(self, x: np.ndarray, y: np.ndarray, sign: float) -> None:
+        """Adds (sign=1) or removes (sign=-1) a batch of days of shape (T, N) and (T, M)."""
+        valid_x, valid_y = ~np.isnan(x), ~np.isnan(y)
+        x, y = np.where(valid_x, x, 0.0), np.where(valid_y, y, 0.0)
+        valid_x, valid_y = valid_x.astype(float), valid_y.astype(float)
+
+        # sums over the days on which both series of a pair have a value
+        self.n += sign * valid_x.T @ valid_y
+        self.sum_x += sign * x.T @ valid_y
+        self.sum_y += sign * valid_x.T @ y
+        self.sum_xx += sign * (x**2).T @ valid_y
+        self.sum_yy += sign * valid_x.T @ y**2
+        self.sum_xy += sign * x.T @ y
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> None:
+        """
+        Appends one or more days and drops the days that left the window.
+
+        Args:
+            x (np.ndarray): Values of the first group, shape (N,) or (T, N).
+            y (np.ndarray): Values of the second group, shape (M,) or (T, M).
+        """
+        x, y = np.atleast_2d(x).astype(float), np.atleast_2d(y).astype(float)
+        self._add(x, y, 1.0)
+
+        if self.window is None:
+            return
+        self._days.extend(zip(x, y))
+        n_expired = len(self._days) - self.window
+        if n_expired > 0:
+            expired = [self._days.popleft() for _ in range(n_expired)]
+            self._add(
+                np.array([d[0] for d in expired]),
+                np.array([d[1] for d in expired]),
+                -1.0,
+            )
+
+    def correlation(self) -> np.ndarray:
+        """Pearson correlation of every pair, NaN where it is undefined."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = self.n * self.sum_xy - self.sum_x * self.sum_y
+            var_x = self.n * self.sum_xx - self.sum_x**2
+            var_y = self.n * self.sum_yy - self.sum_y**2
+            corr = cov / np.sqrt(var_x * var_y)
+        corr[self.n < 2] = np.nan
+        return np.clip(corr, -1.0, 1.0)
+
+
+def correlation_block(
+    x: pd.DataFrame, y: pd.DataFrame, window: int | None = None
+) -> pd.DataFrame:
+    """
+    Correlation of every column of `x` with every column of `y`, over the
+    last `window` rows (all rows if None).
+
+    Returns:
+        pd.DataFrame: Correlations with the columns of `x` as index and the
+            columns of `y` as columns.
+    """
+    engine = RollingCorrelation(x.shape[1], y.shape[1], window=None)
+    rows = slice(None) if window is None else slice(-window, None)
+    engine.update(x.to_numpy()[rows], y.to_numpy()[rows])
+    return pd.DataFrame(engine.correlation(), index=x.columns, columns=y.columns)
+
+
+def rolling_correlation(x: pd.DataFrame, y: pd.DataFrame, window: int):
+    """
+    Yields the date and the `window`-day correlation block (see
+    `correlation_block`) for every row of the aligned frames `x` and `y`.
+    """
+    engine = RollingCorrelation(x.shape[1], y.shape[1], window=window)
+    for date, x_day, y_day in zip(x.index, x.to_numpy(), y.to_numpy()):
+        engine.update(x_day, y_day)
+        yield date, engine.correlation()
+
+
+def rank_candidates(
+    portfolio_returns: pd.DataFrame,
+    candidates_returns: pd.DataFrame,
+    window: int | None = None,
+) -> pd.DataFrame:
+    """
+    Ranks candidates by their correlation with the portfolio, least
+    correlated first.
+
+    Args:
+        portfolio_returns (pd.DataFrame): Daily returns of the holdings.
+        candidates_returns (pd.DataFrame): Daily returns of the candidates,
+            aligned with `portfolio_returns`.
+        window (int | None): Number of most recent days to use.
+
+    Returns:
+        pd.DataFrame: Per candidate the correlation with the equally weighted
+            portfolio, the mean and the maximum correlation with a holding, and
+            the holding of the maximum.
+    """
+    holdings = portfolio_returns.assign(portfolio=portfolio_returns.mean(axis=1))
+    block = correlation_block(holdings, candidates_returns, window=window)
+
+    per_holding = block.drop(index="portfolio")
+    return (
+        pd.DataFrame(
+            {
+                "corr_portfolio": block.loc["portfolio"],
+                "mean_corr": per_holding.mean(),
+                "max_corr": per_holding.max(),
+                "max_corr_with": per_holding.apply(
+                    lambda corr: corr.idxmax() if corr.notna().any() else None
+                ),
+            }
+        )
+        .rename_axis("candidate")
+        .sort_values("corr_portfolio")
+        .reset_index()
+    )
@@ -1,38 +1,91 @@
-# %%
-import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
-import toml
-import yfinance as yf
-
-_config = toml.load("config/portfolio.toml")
-portfolio_tickers = _config.get("portfolio")
-candidates_tickers = _config.get("candidates")
-
-# %%
-# portfolio
-yf_tickers_portfolio = yf.Tickers(" ".join(portfolio_tickers))
-portfolio_prices = yf_tickers_portfolio.history()["Close"]
-portfolio_returns = portfolio_prices.pct_change()
-
-fig, axes = plt.subplots(1, 1, figsize=(15, 13))
-sns.heatmap(portfolio_returns.corr(), annot=True, ax=axes, cmap="coolwarm")
-plt.title("Portfolio Correlation", size=18)
-
-
-# Candidates
-yf_tickers_potentials = yf.Tickers(" ".join(candidates_tickers))
-candidates_prices = yf_tickers_potentials.history()["Close"]
-candidates_returns = candidates_prices.pct_change()
-
-# %%
-fig, axes = plt.subplots(1, 1, figsize=(15, 13))
-sns.heatmap(
-    pd.concat([portfolio_returns, candidates_returns], axis=1).corr(),
-    annot=True,
-    ax=axes,
-    cmap="coolwarm",
-)
-plt.title("Portfolio Correlation + CANDIDATES", size=18)
-plt.axvline(x=len(portfolio_prices), color="k", linewidth=2.5)
-plt.axhline(y=len(portfolio_prices), color="k", linewidth=2.5)
+
+from portfolio.correlation import correlation_block, rank_candidates
+from utils.config import load_config
+from utils.data import get_histories
+from utils.log import log
+
+# larger heatmaps are drawn without the values written into the cells
+MAX_ANNOTATED_CELLS = 400
+
+
+def load_returns(
+    portfolio_tickers: list[str], candidates_tickers: list[str], period: str = "1mo"
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Daily returns of the portfolio and the candidates. Tickers without data
+    are left out with a warning.
+    """
+    histories = get_histories(portfolio_tickers + candidates_tickers, period)
+    missing = [t for t in portfolio_tickers + candidates_tickers if t not in histories]
+    if missing:
+        log.warning(f"No price data for {', '.join(missing)}, leaving them out")
+
+    portfolio, candidates = set(portfolio_tickers), set(candidates_tickers)
+    portfolio_prices = pd.DataFrame(
+        {t: h["Close"] for t, h in histories.items() if t in portfolio}
+    )
+    candidates_prices = pd.DataFrame(
+        {t: h["Close"] for t, h in histories.items() if t in candidates}
+    )
+    return portfolio_prices.pct_change(), candidates_prices.pct_change()
+
+
+def plot_correlation(
+    portfolio_returns: pd.DataFrame,
+    candidates_returns: pd.DataFrame,
+    window: int | None = None,
+    output_dir: str = "out",
+) -> None:
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # portfolio
+    corr = correlation_block(portfolio_returns, portfolio_returns, window=window)
+    fig, axes = plt.subplots(1, 1, figsize=(15, 13))
+    sns.heatmap(corr, annot=True, ax=axes, cmap="coolwarm")
+    plt.title("Portfolio Correlation", size=18)
+    plt.savefig(f"{output_dir}/portfolio_corr.png", bbox_inches="tight")
+    plt.close(fig)
+
+    # Candidates, only their correlation with the holdings
+    corr = correlation_block(portfolio_returns, candidates_returns, window=window)
+    fig, axes = plt.subplots(
+        1, 1, figsize=(max(15, 0.4 * corr.shape[1]), max(5, 0.6 * corr.shape[0]))
+    )
+    sns.heatmap(
+        corr,
+        annot=corr.size <= MAX_ANNOTATED_CELLS,
+        ax=axes,
+        cmap="coolwarm",
+        vmin=-1,
+        vmax=1,
+    )
+    plt.title("Portfolio Correlation + CANDIDATES", size=18)
+    plt.savefig(f"{output_dir}/portfolio_corr_candidates.png", bbox_inches="tight")
+    plt.close(fig)
+
+
+def main(
+    config_path: str = "config/portfolio.toml",
+    period: str = "1mo",
+    window: int | None = None,
+    output_dir: str = "out",
+) -> pd.DataFrame:
+    config = load_config(config_path)
+    portfolio_returns, candidates_returns = load_returns(
+        config.get("portfolio"), config.get("candidates"), period=period
+    )
+
+    ranking = rank_candidates(portfolio_returns, candidates_returns, window=window)
+    ranking.to_csv(f"{output_dir}/portfolio_corr_candidates.csv", index=False)
+    log.info(f"Least correlated candidates:\n{ranking.head(10).to_string(index=False)}")
+
+    plot_correlation(
+        portfolio_returns, candidates_returns, window=window, output_dir=output_dir
+    )
+    return ranking
+
+
+if __name__ == "__main__":
+    main()
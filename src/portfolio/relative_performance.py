@@ -1,15 +1,15 @@
-# %%
-import matplotlib.pyplot as plt
-import pandas as pd
 import polars as pl
-import seaborn as sns
-import yfinance as yf
-from IPython.display import set_matplotlib_formats
 
-set_matplotlib_formats("pdf", "svg")
+from portfolio.analytics import (
+    align_start,
+    calendar_year_returns,
+    collect,
+    summary,
+    total_return,
+)
+from utils.data import scan_prices
 
-# %%
-tickers = [
+DEFAULT_TICKERS = [
     # "JEPI",
     # "JEPQ",
     "SCHD",
@@ -19,53 +19,63 @@ tickers = [
     "DGRO",
     "DGRW",
     # "VYM",
-    "VIG"
+    "VIG",
     # "COWZ",
 ]
-data = yf.Tickers(tickers).history("7y")[["Dividends", "Close"]]
-close, divis = data["Close"], data["Dividends"]
 
-# %%
-missing = close.isna().any(axis=1)
-close, divis = close[~missing], divis[~missing]
 
-# %%
-yoy_performance = (
-    pl.from_pandas(close, include_index=True)
-    .with_columns(
-        (pl.col(tickers).pct_change() + 1).cumprod().over(pl.col("Date").dt.year())
+def load_returns(tickers: list[str], period: str = "7y") -> pl.LazyFrame:
+    """Total returns from the first date on which all tickers have a price."""
+    prices = scan_prices(tickers, period=period, auto_adjust=False)
+    return total_return(align_start(prices))
+
+
+def plot_performance(
+    history: pl.DataFrame, yoy: pl.DataFrame, output_dir: str = "out"
+) -> None:
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig, ax = plt.subplots(figsize=(13, 6))
+    sns.pointplot(data=yoy.to_pandas(), x="year", y="return", hue="ticker", ax=ax)
+    plt.savefig(f"{output_dir}/yoy_performance.png", bbox_inches="tight")
+    plt.close(fig)
+
+    history = history.to_pandas()
+
+    fig, ax = plt.subplots(figsize=(13, 6))
+    sns.lineplot(data=history, y="price_index", hue="ticker", x="date", ax=ax)
+    sns.despine()
+    plt.savefig(f"{output_dir}/relative_performance.png", bbox_inches="tight")
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(13, 6))
+    sns.lineplot(data=history, y="tr_index", hue="ticker", x="date", ax=ax)
+    sns.despine()
+    plt.savefig(
+        f"{output_dir}/relative_performance_reinvested.png", bbox_inches="tight"
     )
-    .group_by(pl.col("Date").dt.year())
-    .agg(pl.col(tickers).last())
-)
-print(yoy_performance)
+    plt.close(fig)
 
-# %%
-fig, ax = plt.subplots(figsize=(13, 6))
-sns.pointplot(
-    data=yoy_performance.melt(id_vars=["Date"]).to_pandas(),
-    x="Date",
-    y="value",
-    hue="variable",
-    ax=ax
-)
-# %%
-close_divs_reinvested = close + divis.cumsum()
-close = close / close.iloc[0]
-close_divs_reinvested = close_divs_reinvested / close_divs_reinvested.iloc[0]
 
-# %%
-plot_close = close.reset_index().melt(var_name="ticker", id_vars="Date")
-plot_close_divs_reinvested = close_divs_reinvested.reset_index().melt(
-    var_name="ticker", id_vars="Date"
-)
+def main(
+    tickers: list[str] | None = None,
+    period: str = "7y",
+    output_dir: str = "out",
+    streaming: bool = False,
+) -> None:
+    returns = load_returns(tickers or DEFAULT_TICKERS, period=period)
+    history, yoy, stats = collect(
+        returns.select("date", "ticker", "price_index", "tr_index"),
+        calendar_year_returns(returns),
+        summary(returns),
+        streaming=streaming,
+    )
+
+    print(yoy.pivot(on="ticker", index="year", values="return"))
+    print(stats)
+    plot_performance(history, yoy, output_dir=output_dir)
 
-# %%
-fig, ax = plt.subplots(figsize=(13, 6))
-sns.lineplot(data=plot_close, y="value", hue="ticker", x="Date", ax=ax)
-sns.despine()
 
-# %%
-fig, ax = plt.subplots(figsize=(13, 6))
-sns.lineplot(data=plot_close_divs_reinvested, y="value", hue="ticker", x="Date", ax=ax)
-sns.despine()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Incremental LaTeX builds.
+
+A report is only compiled when its LaTeX source or one of the images it
+includes changed since the last build. The hash of the inputs is stored next
+to the PDF (`<name>.hash`), so unchanged reports skip the LaTeX toolchain.
+"""
+
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from pylatex import Document
+
+from utils import trace
+from utils.log import log
+
+INCLUDEGRAPHICS = re.compile(r"\\includegraphics(?:\[[^\]]*\])?\{([^}]*)\}")
+
+
+def content_hash(tex: str, directory: Path) -> str:
+    """
+    Hashes the LaTeX source and every image it includes.
+
+    Args:
+        tex (str): LaTeX source of the document.
+        directory (Path): Directory that image paths are relative to.
+
+    Returns:
+        str: Hex digest of the build inputs.
+    """
+    digest = hashlib.sha256(tex.encode())
+    for image in sorted(set(INCLUDEGRAPHICS.findall(tex))):
+        path = directory / image
+        digest.update(image.encode())
+        # a missing image changes the hash, so the build runs and LaTeX reports it
+        digest.update(path.read_bytes() if path.exists() else b"<missing>")
+    return digest.hexdigest()
+
+
+def build_pdf(
+    doc: Document, filepath: str | None = None, force: bool = False, **kwargs
+) -> bool:
+    """
+    Compiles `doc` unless the PDF was already built from identical inputs.
+
+    Args:
+        doc (Document): Document to compile.
+        filepath (str | None): Output path without extension, defaults to the
+            document's own path.
+        force (bool): Compile even if nothing changed.
+        **kwargs: Passed on to `Document.generate_pdf`.
+
+    Returns:
+        bool: Whether the document was compiled.
+    """
+    filepath = Path(filepath or doc.default_filepath)
+    # names like BRK.B contain dots, so append rather than replace a suffix
+    pdf, stamp = Path(f"{filepath}.pdf"), Path(f"{filepath}.hash")
+
+    with trace.span("hash"):
+        digest = content_hash(doc.dumps(), filepath.parent)
+    if not force and pdf.exists() and stamp.exists() and stamp.read_text() == digest:
+        log.info(f"{pdf} is up to date")
+        return False
+
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with trace.span("latex", file=str(pdf)):
+        doc.generate_pdf(str(filepath), **kwargs)
+    stamp.write_text(digest)
+    return True
+
+
+def build_many(
+    docs: list[Document],
+    force: bool = False,
+    max_workers: int | None = None,
+    **kwargs,
+) -> list[bool]:
+    """
+    Builds several documents in parallel, skipping unchanged ones.
+
+    The compiler runs in a subprocess, so threads are enough to keep several
+    LaTeX runs busy at once.
+
+    Returns:
+        list[bool]: Whether each document was compiled.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        build = trace.with_context(build_pdf)
+        return list(pool.map(lambda doc: build(doc, force=force, **kwargs), docs))
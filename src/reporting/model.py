@@ -0,0 +1,76 @@
+"""
+Backend-neutral report content.
+
+Reports are assembled from sections, tables and images once and then rendered
+by `reporting.render` to LaTeX for the PDF archive, or to self-contained HTML
+and Markdown files that are written in milliseconds.
+"""
+
+from typing import NamedTuple, Sequence, Union
+
+
+class Symbol(NamedTuple):
+    """Text that LaTeX typesets from its own markup."""
+
+    text: str
+    latex: str
+
+
+SUM = Symbol("Σ", r"$\Sigma$")
+
+Cell = Union[str, int, float, Symbol]
+
+
+class Table(NamedTuple):
+    """
+    Args:
+        header (Sequence[str]): Column titles, shown in bold.
+        rows (Sequence[Sequence[Cell]]): Body rows.
+        totals (Sequence[Sequence[Cell]]): Rows below a rule, e.g. sums.
+        note (str | None): Small print below the table.
+        align (str | None): Column alignment as a LaTeX spec, e.g. "lccc".
+        floating (bool): LaTeX `table` float instead of a centered block.
+        row_height (float | None): LaTeX `arraystretch`.
+    """
+
+    header: Sequence[str]
+    rows: Sequence[Sequence[Cell]]
+    totals: Sequence[Sequence[Cell]] = ()
+    note: str | None = None
+    align: str | None = None
+    floating: bool = True
+    row_height: float | None = None
+
+
+class Image(NamedTuple):
+    """Image file, relative to the directory of the rendered report."""
+
+    path: str
+    width: str = "500px"
+
+
+class PageBreak(NamedTuple):
+    pass
+
+
+class Section(NamedTuple):
+    """
+    Args:
+        title (str): Heading.
+        blocks (list): Tables, images, page breaks or nested sections.
+        level (int): 1 for sections, 2 for subsections.
+        numbered (bool): Whether LaTeX numbers the heading.
+    """
+
+    title: str
+    blocks: list
+    level: int = 1
+    numbered: bool = True
+
+
+Block = Union[Table, Image, PageBreak, Section]
+
+
+class Report(NamedTuple):
+    title: str
+    blocks: list[Block]
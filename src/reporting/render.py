@@ -0,0 +1,232 @@
+"""
+Renders `reporting.model` reports to LaTeX, HTML or Markdown.
+
+LaTeX content is appended to a pylatex `Document`, whose preamble and title
+stay with the report. HTML and Markdown files are self-contained: images are
+embedded inline, so the files can be opened or served on their own.
+"""
+
+import base64
+import html
+from pathlib import Path
+
+from pylatex import Center, Command, Document, Figure, NoEscape, Package
+from pylatex import Section as LatexSection
+from pylatex import Subsection
+from pylatex import Table as LatexTable
+from pylatex import Tabular
+from pylatex.utils import escape_latex
+
+from reporting.model import (
+    Block,
+    Cell,
+    Image,
+    PageBreak,
+    Report,
+    Section,
+    Symbol,
+    Table,
+)
+
+HTML_STYLE = """
+body { font-family: sans-serif; max-width: 60em; margin: 2em auto; }
+table { border-collapse: collapse; margin: 1em auto; }
+th, td { padding: 0.2em 0.8em; text-align: center; }
+th { border-bottom: 1px solid; }
+thead { border-top: 2px solid; }
+tbody { border-bottom: 2px solid; }
+tfoot tr:first-child td { border-top: 1px solid; }
+caption { caption-side: bottom; font-size: small; }
+img { display: block; margin: 1em auto; max-width: 100%; }
+"""
+
+MARKDOWN_ALIGN = {"l": ":--", "c": ":-:", "r": "--:"}
+
+
+def _text(cell: Cell) -> str:
+    return cell.text if isinstance(cell, Symbol) else str(cell)
+
+
+# %% LaTeX
+
+
+def _latex_cell(cell: Cell):
+    if isinstance(cell, Symbol):
+        return NoEscape(cell.latex)
+    return cell
+
+
+def _latex_table(doc: Document, table: Table) -> None:
+    align = table.align or "l" + "c" * (len(table.header) - 1)
+    tabular = Tabular(table_spec=align, row_height=table.row_height, booktabs=False)
+    tabular.append(Command("toprule"))
+    tabular.add_row([Command("textbf", h) for h in table.header])
+    tabular.append(Command("midrule"))
+    for row in table.rows:
+        tabular.add_row([_latex_cell(c) for c in row])
+    if table.totals:
+        tabular.append(Command("midrule"))
+        for row in table.totals:
+            tabular.add_row([_latex_cell(c) for c in row])
+    tabular.append(Command("bottomrule"))
+    if table.note is not None:
+        tabular.append(
+            Command(
+                "multicolumn",
+                [
+                    len(align.replace("|", "")),
+                    "c",
+                    NoEscape(f"\\footnotesize {escape_latex(table.note)}"),
+                ],
+            )
+        )
+
+    if table.floating:
+        with doc.create(LatexTable(position="!ht")) as t:
+            t.append(Command("centering"))
+            t.append(tabular)
+    else:
+        with doc.create(Center()) as c:
+            c.append(tabular)
+
+
+def to_latex(doc: Document, blocks: list[Block]) -> Document:
+    """Appends `blocks` to `doc`."""
+    doc.packages.append(Package("booktabs"))
+
+    for block in blocks:
+        if isinstance(block, Section):
+            heading = LatexSection if block.level == 1 else Subsection
+            doc.append(heading(block.title, numbering=block.numbered))
+            to_latex(doc, block.blocks)
+        elif isinstance(block, Table):
+            _latex_table(doc, block)
+        elif isinstance(block, Image):
+            with doc.create(Figure(position="h!")) as fig:
+                fig.add_image(filename=block.path, width=block.width)
+        elif isinstance(block, PageBreak):
+            doc.append(Command("newpage"))
+
+    return doc
+
+
+# %% HTML
+
+
+def _data_uri(path: Path) -> str:
+    mime = "image/svg+xml" if path.suffix == ".svg" else f"image/{path.suffix[1:]}"
+    return f"data:{mime};base64,{base64.b64encode(path.read_bytes()).decode()}"
+
+
+def _html_cell(cell: Cell) -> str:
+    return html.escape(_text(cell))
+
+
+def _html_rows(rows, tag: str = "td") -> str:
+    return "".join(
+        "<tr>" + "".join(f"<{tag}>{_html_cell(c)}</{tag}>" for c in row) + "</tr>"
+        for row in rows
+    )
+
+
+def _html_blocks(blocks: list[Block], directory: Path) -> list[str]:
+    parts = []
+    for block in blocks:
+        if isinstance(block, Section):
+            tag = f"h{block.level + 1}"
+            parts.append(f"<{tag}>{html.escape(block.title)}</{tag}>")
+            parts.extend(_html_blocks(block.blocks, directory))
+        elif isinstance(block, Table):
+            note = (
+                f"<caption>{html.escape(block.note)}</caption>"
+                if block.note is not None
+                else ""
+            )
+            parts.append(
+                f"<table>{note}"
+                f"<thead>{_html_rows([block.header], 'th')}</thead>"
+                f"<tbody>{_html_rows(block.rows)}</tbody>"
+                f"<tfoot>{_html_rows(block.totals)}</tfoot></table>"
+            )
+        elif isinstance(block, Image):
+            uri = _data_uri(directory / block.path)
+            parts.append(f'<img src="{uri}" width="{block.width}">')
+        elif isinstance(block, PageBreak):
+            parts.append('<div style="break-after: page"></div>')
+    return parts
+
+
+def to_html(report: Report, directory: Path = Path(".")) -> str:
+    """
+    Renders `report` as a standalone HTML page.
+
+    Args:
+        report (Report): Report to render.
+        directory (Path): Directory that image paths are relative to.
+    """
+    body = "\n".join(_html_blocks(report.blocks, directory))
+    return (
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset='utf-8'>\n"
+        f"<title>{html.escape(report.title)}</title>\n"
+        f"<style>{HTML_STYLE}</style>\n</head>\n<body>\n"
+        f"<h1>{html.escape(report.title)}</h1>\n{body}\n</body>\n</html>\n"
+    )
+
+
+# %% Markdown
+
+
+def _markdown_row(row) -> str:
+    cells = (_text(c).replace("|", "\\|") for c in row)
+    return "| " + " | ".join(cells) + " |"
+
+
+def _markdown_blocks(blocks: list[Block], directory: Path) -> list[str]:
+    parts = []
+    for block in blocks:
+        if isinstance(block, Section):
+            parts.append(f"{'#' * (block.level + 1)} {block.title}")
+            parts.extend(_markdown_blocks(block.blocks, directory))
+        elif isinstance(block, Table):
+            align = (block.align or "l" + "c" * (len(block.header) - 1)).replace(
+                "|", ""
+            )
+            lines = [
+                _markdown_row(f"**{h}**" for h in block.header),
+                "| " + " | ".join(MARKDOWN_ALIGN[a] for a in align) + " |",
+                *(_markdown_row(r) for r in block.rows),
+                *(_markdown_row(r) for r in block.totals),
+            ]
+            if block.note is not None:
+                lines.append(f"\n*{block.note}*")
+            parts.append("\n".join(lines))
+        elif isinstance(block, Image):
+            uri = _data_uri(directory / block.path)
+            parts.append(f"![{Path(block.path).stem}]({uri})")
+    return parts
+
+
+def to_markdown(report: Report, directory: Path = Path(".")) -> str:
+    """
+    Renders `report` as Markdown with inline images.
+
+    Args:
+        report (Report): Report to render.
+        directory (Path): Directory that image paths are relative to.
+    """
+    return (
+        "\n\n".join([f"# {report.title}", *_markdown_blocks(report.blocks, directory)])
+        + "\n"
+    )
+
+
+def write_report(report: Report, path: str) -> Path:
+    """Writes `report` as HTML or Markdown, depending on the suffix of `path`."""
+    path = Path(path)
+    renderers = {".html": to_html, ".md": to_markdown}
+    if path.suffix not in renderers:
+        raise ValueError(f"Unsupported report format: {path.suffix}")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(renderers[path.suffix](report, path.parent), encoding="utf-8")
+    return path
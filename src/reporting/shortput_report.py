@@ -1,9 +1,24 @@
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-import toml
-import yfinance as yf
-from pylatex import Center, Command, Document, Figure, Subsection, Tabular, TextColor
-from pylatex.utils import NoEscape, italic
+from pylatex import Center, Command, Document, TextColor
+from pylatex.utils import NoEscape
+
+from options.expected_move import compute_bands, plot_expected_move
+from options.expected_move_reliability import (
+    backtest_length,
+    plot_reliability,
+    run_backtest,
+)
+from reporting.build import build_many
+from reporting.model import Image, Report, Section, Table
+from reporting.render import to_latex, write_report
+from utils import trace
+from utils.config import load_config
+from utils.data import get_history, refresh
+
+TITLE = "Expected Movement Report"
 
 
 def create_preamble(doc: Document):
@@ -22,60 +37,139 @@ def create_preamble(doc: Document):
     return doc
 
 
-def fill_document(doc: Document, ticker: str, dte: int):
-    """Fills document with content"""
-    yf_ticker = yf.Ticker(ticker)
-    price = yf_ticker.history("1d")["Close"].to_list()[-1]
+def create_report(ticker: str, price: float, dte: int) -> Report:
+    """Creates the backend-neutral report content"""
     expiration = datetime.datetime.today() + datetime.timedelta(days=dte)
 
-    with doc.create(Center()):
-        # doc.append(NoEscape("{\sffamily"))
-        with doc.create(Tabular("cc|cc", row_height=1.1, booktabs=True)) as table:
-            table.add_hline()
-            # table.add_row(Command("textbf", "Attribute"), Command("textbf", "Value"))
-            headers = ("Ticker", "Last Price", "Expiration", "DTE")
-            values = (ticker, f"${price:.2f}", f"{expiration:%Y-%m-%d}", dte)
-
-            table.add_row(*(Command("textbf", x) for x in headers))
-            table.add_hline()
-            table.add_row(*values)
-        # doc.append(NoEscape("}"))
-
-    with doc.create(Subsection("Expected Move", numbering=False)):
-        with doc.create(Figure(position="h!")) as fig:
-            fig.add_image(filename="expected_move.png", width="500px")
-
-    with doc.create(
-        Subsection("Expected Move - Historic Reliability", numbering=False)
-    ):
-        with doc.create(Figure(position="h!")) as fig:
-            fig.add_image(filename="expected_move_reliability.png", width="500px")
-
-    return doc
+    return Report(
+        TITLE,
+        [
+            Table(
+                header=["Ticker", "Last Price", "Expiration", "DTE"],
+                rows=[[ticker, f"${price:.2f}", f"{expiration:%Y-%m-%d}", dte]],
+                align="cc|cc",
+                floating=False,
+                row_height=1.1,
+            ),
+            Section(
+                "Expected Move",
+                [Image("expected_move.png")],
+                level=2,
+                numbered=False,
+            ),
+            Section(
+                "Expected Move - Historic Reliability",
+                [Image("expected_move_reliability.png")],
+                level=2,
+                numbered=False,
+            ),
+        ],
+    )
 
 
 def create_title(doc: Document):
     with doc.create(Center()):
         doc.append(NoEscape("{ \LARGE"))
-        doc.append(TextColor("blue", Command("textbf", "Expected Movement Report")))
+        doc.append(TextColor("blue", Command("textbf", TITLE)))
         doc.append(NoEscape("}"))
 
     return doc
 
 
-if __name__ == "__main__":
-    config = toml.load("config/shortput.toml")
-    TICKER = config.get("TICKER")
-    DTE = config.get("DTE")
-
+def create_document(report: Report, filepath: str = "out/shortput_report") -> Document:
     # Basic document
-    doc = Document("out/shortput_report")
+    doc = Document(filepath)
 
     # Boilerplate
     doc = create_preamble(doc)
     doc = create_title(doc)
 
     # Sections
-    doc = fill_document(doc, ticker=TICKER, dte=DTE)
+    to_latex(doc, report.blocks)
+
+    return doc
+
 
-    doc.generate_pdf(clean=True, clean_tex=True)
+def prepare_report(ticker: str, config: dict, output_dir: str = "out") -> Report:
+    """
+    Computes the expected move and its reliability for `ticker`, saves the
+    plots to `output_dir` and returns the report content.
+
+    The history is fetched once and shared by all stages. The backtest runs in
+    the background while the bands are computed and plotted.
+    """
+    with trace.span("load"):
+        yft = get_history(ticker, config.get("PERIOD"))
+    dte, p_itm = config.get("DTE"), config.get("P_ITM")
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        backtest = pool.submit(
+            trace.with_context(run_backtest), yft, config, ticker=ticker
+        )
+
+        lower_bound, upper_bound = compute_bands(yft, config)
+        band_plot = pool.submit(
+            trace.with_context(plot_expected_move),
+            yft,
+            lower_bound,
+            upper_bound,
+            dte,
+            path=f"{output_dir}/expected_move.png",
+        )
+
+        cutoffs, result = backtest.result()
+        reliability_plot = pool.submit(
+            trace.with_context(plot_reliability),
+            cutoffs,
+            result,
+            n_returns=backtest_length(cutoffs, dte, len(yft)),
+            p_itm=p_itm,
+            thresh=config.get("THRESH", "lower"),
+            path=f"{output_dir}/expected_move_reliability.png",
+        )
+
+        report = create_report(ticker, yft["Close"].iloc[-1], dte)
+        band_plot.result()
+        reliability_plot.result()
+
+    return report
+
+
+def main(
+    config_path: str = "config/shortput.toml",
+    force: bool = False,
+    fmt: str = "pdf",
+    **overrides,
+) -> None:
+    """
+    Builds the short put report of `TICKER`, or one report per ticker in
+    `out/shortput/<ticker>/` if `TICKERS` is configured.
+
+    `fmt` is "pdf", or "html"/"md" for self-contained files that skip LaTeX.
+    PDFs whose LaTeX source and plots did not change are not recompiled
+    unless `force` is set.
+    """
+    config = load_config(config_path, **overrides)
+    if overrides.get("TICKER") or not config.get("TICKERS"):
+        output_dirs = {config.get("TICKER"): "out"}
+    else:
+        output_dirs = {t: f"out/shortput/{t}" for t in config.get("TICKERS")}
+
+    # fetch all histories in one concurrent batch
+    refresh(list(output_dirs))
+    reports = {}
+    for ticker, output_dir in output_dirs.items():
+        with trace.span("prepare_report", ticker=ticker):
+            reports[output_dir] = prepare_report(ticker, config, output_dir)
+
+    if fmt == "pdf":
+        docs = [create_document(r, f"{d}/shortput_report") for d, r in reports.items()]
+        build_many(docs, force=force, clean=True, clean_tex=True)
+    else:
+        for d, report in reports.items():
+            write_report(report, f"{d}/shortput_report.{fmt}")
+
+
+if __name__ == "__main__":
+    main()
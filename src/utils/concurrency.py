@@ -0,0 +1,121 @@
+"""
+Helpers for fetching many items from a network API concurrently.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Hashable, TypeVar
+
+from rich.progress import track
+
+from utils import trace
+from utils.log import log
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class RateLimiter:
+    """Thread-safe token bucket allowing `rate` calls per second (bursts up to `burst`)."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host: str, rate: float = 5.0, burst: int = 5) -> RateLimiter:
+    """Returns the process-wide rate limiter for `host` (created on first use)."""
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(rate, burst)
+        return _rate_limiters[host]
+
+
+def retry(
+    func: Callable[[], V],
+    retries: int = 3,
+    backoff: float = 1.0,
+    rate_limiter: RateLimiter | None = None,
+) -> V:
+    """
+    Calls `func`, retrying failed calls with exponential backoff and jitter
+    (`backoff`, 2 * `backoff`, ... seconds).
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return func()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2**attempt * (1 + random.random()))
+
+
+def fetch_concurrently(
+    func: Callable[[K], V],
+    items: list[K],
+    host: str,
+    max_workers: int = 8,
+    retries: int = 3,
+    backoff: float = 1.0,
+    description: str = "Fetching...",
+) -> dict[K, V]:
+    """
+    Applies `func` to all `items` on a thread pool, rate limited per `host`.
+
+    A failing item is retried and, if it still fails, logged and left out of
+    the result, so one bad ticker does not abort the whole fetch.
+
+    Returns:
+        dict[K, V]: Result per successfully fetched item.
+    """
+    if not items:
+        return {}
+
+    rate_limiter = get_rate_limiter(host)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(
+                trace.with_context(retry),
+                lambda item=item: func(item),
+                retries,
+                backoff,
+                rate_limiter,
+            ): item
+            for item in items
+        }
+        for future in track(
+            as_completed(futures), total=len(futures), description=description
+        ):
+            item = futures[future]
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                log.warning(f"Failed to fetch {item}: {e}")
+
+    return results
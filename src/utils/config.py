@@ -0,0 +1,11 @@
+import toml
+
+
+def load_config(path: str, **overrides) -> dict:
+    """
+    Loads a TOML config file and applies `overrides` (e.g. from command line
+    flags) on top of it. Overrides that are None are ignored.
+    """
+    config = toml.load(path)
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
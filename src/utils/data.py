@@ -1,6 +1,459 @@
-# %%
-import yfinance as yf
+"""
+Local price/dividend store.
 
-t = yf.Ticker("TSLA")
+Daily bars are kept as one Parquet partition per ticker
+(``out/cache/prices/ticker=<TICKER>/data.parquet``). On refresh only the missing
+tail of each ticker's history is downloaded, so `period="max"` requests are
+served from local disk once a ticker has been fetched.
+"""
 
-# %%
+import datetime
+import json
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import joblib
+import pandas as pd
+
+from utils import trace
+from utils.concurrency import fetch_concurrently
+from utils.log import log
+
+if TYPE_CHECKING:
+    import polars as pl
+
+STORE_PATH = Path("out/cache/prices")
+DIVIDEND_CACHE_PATH = Path("out/cache/dividends")
+YAHOO_HOST = "query2.finance.yahoo.com"
+
+# raw (not dividend-adjusted) columns as returned by `yf.download(auto_adjust=False)`
+COLUMNS = [
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "Adj Close",
+    "Volume",
+    "Dividends",
+    "Stock Splits",
+]
+_PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+_PERIOD_PATTERN = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+
+def _normalize(data: pd.DataFrame) -> pd.DataFrame:
+    """Brings a downloaded frame into the stored layout (tz-naive daily index)."""
+    data = data.reindex(columns=COLUMNS).dropna(subset=["Close"])
+    data[["Dividends", "Stock Splits"]] = data[["Dividends", "Stock Splits"]].fillna(
+        0.0
+    )
+
+    index = pd.DatetimeIndex(data.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    data.index = index.normalize().rename("Date")
+
+    return data[~data.index.duplicated(keep="last")].sort_index()
+
+
+def _period_start(period: str, today: datetime.date) -> pd.Timestamp | None:
+    """Translates a yfinance period string into a start date (`None` = all data)."""
+    if period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(today.year, 1, 1)
+
+    match = _PERIOD_PATTERN.match(period)
+    if match is None:
+        raise ValueError(f"Unsupported period: {period}")
+
+    n, unit = int(match.group(1)), match.group(2)
+    offset = {
+        "wk": pd.DateOffset(weeks=n),
+        "mo": pd.DateOffset(months=n),
+        "y": pd.DateOffset(years=n),
+    }.get(unit)
+    if offset is None:  # "d" periods count trading days and are handled by the caller
+        return None
+
+    return pd.Timestamp(today) - offset
+
+
+class PriceStore:
+    def __init__(
+        self,
+        path: str | Path = STORE_PATH,
+        max_age: datetime.timedelta = datetime.timedelta(hours=1),
+        max_workers: int = 8,
+    ) -> None:
+        """
+        Args:
+            path (str | Path): Root directory of the partitioned Parquet store.
+            max_age (datetime.timedelta): Local data younger than this is served
+                without contacting the data provider.
+            max_workers (int): Number of concurrent downloads.
+        """
+        self.path = Path(path)
+        self.max_age = max_age
+        self.max_workers = max_workers
+
+    def _partition(self, ticker: str) -> Path:
+        return self.path / f"ticker={ticker}"
+
+    def _read(self, ticker: str) -> pd.DataFrame | None:
+        file = self._partition(ticker) / "data.parquet"
+        if not file.exists():
+            return None
+        return pd.read_parquet(file)
+
+    def _write(self, ticker: str, data: pd.DataFrame) -> None:
+        partition = self._partition(ticker)
+        partition.mkdir(parents=True, exist_ok=True)
+        data.to_parquet(partition / "data.parquet")
+        (partition / "_meta.json").write_text(
+            json.dumps({"fetched_at": datetime.datetime.now().isoformat()})
+        )
+
+    def put(self, ticker: str, data: pd.DataFrame) -> None:
+        """Stores a history obtained elsewhere (e.g. a recorded fixture) as fresh data."""
+        self._write(ticker, _normalize(data))
+
+    def _fetched_at(self, ticker: str) -> datetime.datetime | None:
+        meta = self._partition(ticker) / "_meta.json"
+        if not meta.exists():
+            return None
+        return datetime.datetime.fromisoformat(
+            json.loads(meta.read_text())["fetched_at"]
+        )
+
+    def is_stale(self, ticker: str) -> bool:
+        fetched_at = self._fetched_at(ticker)
+        return fetched_at is None or datetime.datetime.now() - fetched_at > self.max_age
+
+    @staticmethod
+    def _download(ticker: str, start: pd.Timestamp | None) -> pd.DataFrame:
+        """Downloads raw daily bars for `ticker` (all of them if `start` is None)."""
+        import yfinance as yf
+
+        with trace.span("download", ticker=ticker):
+            data = yf.Ticker(ticker).history(
+                period="max" if start is None else None,
+                start=None if start is None else start.strftime("%Y-%m-%d"),
+                interval="1d",
+                auto_adjust=False,
+                actions=True,
+                raise_errors=True,
+            )
+            data = _normalize(data)
+            # in-memory size, the provider does not expose the transferred bytes
+            trace.count("rows_fetched", len(data))
+            trace.count("bytes_fetched", int(data.memory_usage(deep=True).sum()))
+        if data.empty:
+            raise ValueError(f"No data downloaded for {ticker}")
+        return data
+
+    @staticmethod
+    def _needs_full_refetch(stored: pd.DataFrame, tail: pd.DataFrame) -> bool:
+        """
+        Adjusted closes of the whole history change when a dividend or split
+        happens, so such an event in the new tail invalidates the stored data.
+        """
+        last_date = stored.index[-1]
+        new_rows = tail[tail.index > last_date]
+        if (new_rows[["Dividends", "Stock Splits"]] != 0).any().any():
+            return True
+
+        if last_date not in tail.index:
+            return False
+        stored_ratio = stored.at[last_date, "Adj Close"] / stored.at[last_date, "Close"]
+        tail_ratio = tail.at[last_date, "Adj Close"] / tail.at[last_date, "Close"]
+        return abs(stored_ratio - tail_ratio) > 1e-6
+
+    def refresh(self, tickers: list[str], force: bool = False) -> list[str]:
+        """
+        Brings the local history of `tickers` up to date. Tickers without local
+        data are downloaded completely, all others only from their last stored
+        bar onwards. Downloads run concurrently (rate limited, with retries) and
+        a ticker that keeps failing keeps its current local data.
+
+        Returns:
+            list[str]: Tickers that were downloaded successfully.
+        """
+        stale = [t for t in dict.fromkeys(tickers) if force or self.is_stale(t)]
+        if not stale:
+            return []
+
+        def update(ticker: str) -> None:
+            stored = self._read(ticker)
+            start = None if stored is None or stored.empty else stored.index[-1]
+            data = self._download(ticker, start)
+
+            if start is not None:
+                if self._needs_full_refetch(stored, data):
+                    log.info(f"Adjustments changed, re-downloading {ticker}")
+                    data = self._download(ticker, None)
+                else:
+                    data = pd.concat([stored.loc[: start - pd.Timedelta(days=1)], data])
+
+            self._write(ticker, data)
+
+        with trace.span("fetch", tickers=len(stale)):
+            refreshed = fetch_concurrently(
+                update,
+                stale,
+                host=YAHOO_HOST,
+                max_workers=self.max_workers,
+                description=f"Refreshing {len(stale)} ticker(s)...",
+            )
+        return list(refreshed)
+
+    def history(
+        self, ticker: str, period: str = "max", auto_adjust: bool = True
+    ) -> pd.DataFrame:
+        """
+        Daily history for `ticker`, mirroring `yf.Ticker(ticker).history(period)`.
+
+        Args:
+            ticker (str): Ticker symbol.
+            period (str): yfinance period string ("1d", "5d", "1mo", "2y", "ytd", "max", ...).
+            auto_adjust (bool): Adjust OHLC for dividends and splits like yfinance does.
+                If False, the raw prices and the "Adj Close" column are returned.
+
+        Returns:
+            pd.DataFrame: OHLC, volume and corporate actions indexed by date.
+        """
+        histories = self.histories([ticker], period=period, auto_adjust=auto_adjust)
+        if ticker not in histories:
+            raise KeyError(f"No price history available for {ticker}")
+        return histories[ticker]
+
+    def histories(
+        self,
+        tickers: list[str],
+        period: str = "max",
+        auto_adjust: bool = True,
+        refresh: bool = True,
+    ) -> dict[str, pd.DataFrame]:
+        """
+        Like `history` for many tickers, refreshing all stale ones in bulk
+        (unless `refresh` is False). Tickers without any data are left out of
+        the result.
+        """
+        if refresh:
+            self.refresh(tickers)
+
+        start = _period_start(period, datetime.date.today())
+        n_days = (
+            int(period[:-1]) if period.endswith("d") and period[:-1].isdigit() else None
+        )
+
+        histories = {}
+        for ticker in tickers:
+            data = self._read(ticker)
+            if data is None:
+                log.warning(f"No price history available for {ticker}")
+                continue
+
+            if start is not None:
+                data = data.loc[start:]
+            if n_days is not None:
+                data = data.iloc[-n_days:]
+
+            if auto_adjust:
+                data = data.copy()
+                ratio = data["Adj Close"] / data["Close"]
+                data[_PRICE_COLUMNS] = data[_PRICE_COLUMNS].mul(ratio, axis=0)
+                data = data.drop(columns="Adj Close")
+
+            histories[ticker] = data
+
+        return histories
+
+    def scan(
+        self, tickers: list[str], period: str = "max", auto_adjust: bool = True
+    ) -> "pl.LazyFrame":
+        """
+        Lazy long-format frame of `tickers` read straight from the Parquet
+        partitions (no pandas round trip), refreshing stale tickers first.
+
+        Columns are `date`, `ticker` (categorical), `open`, `high`, `low`,
+        `close` and `dividends`, prices as float32. Tickers without any data
+        are left out.
+
+        Args:
+            tickers (list[str]): Ticker symbols.
+            period (str): yfinance period string ("1d", "5d", "1mo", "2y", "ytd", "max", ...).
+            auto_adjust (bool): Adjust OHLC for dividends and splits like yfinance does.
+        """
+        import polars as pl
+
+        self.refresh(tickers)
+
+        start = _period_start(period, datetime.date.today())
+        n_days = (
+            int(period[:-1]) if period.endswith("d") and period[:-1].isdigit() else None
+        )
+
+        files = []
+        for ticker in dict.fromkeys(tickers):
+            file = self._partition(ticker) / "data.parquet"
+            if file.exists():
+                files.append(file)
+            else:
+                log.warning(f"No price history available for {ticker}")
+        if not files:
+            raise KeyError(f"No price history available for {tickers}")
+
+        # one scan over all files; the ticker comes from the file rather than
+        # from hive partitioning, which breaks on symbols like EURUSD=X
+        ratio = pl.col("Adj Close") / pl.col("Close") if auto_adjust else pl.lit(1.0)
+        frame = pl.scan_parquet(files, include_file_paths="file").select(
+            pl.col("Date").cast(pl.Date).alias("date"),
+            pl.col("file")
+            .str.extract(r"ticker=(.+)[/\\]data\.parquet$")
+            .cast(pl.Categorical)
+            .alias("ticker"),
+            *(
+                (pl.col(c) * ratio).cast(pl.Float32).alias(c.lower())
+                for c in _PRICE_COLUMNS
+            ),
+            pl.col("Dividends").cast(pl.Float32).alias("dividends"),
+        )
+
+        if start is not None:
+            frame = frame.filter(pl.col("date") >= start.date())
+        if n_days is not None:
+            last_days = pl.col("date").rank("ordinal", descending=True).over("ticker")
+            frame = frame.filter(last_days <= n_days)
+        return frame
+
+    def dividends(self, ticker: str) -> pd.Series:
+        """Dividend history for `ticker`, mirroring `yf.Ticker(ticker).dividends`."""
+        data = self.history(ticker, period="max", auto_adjust=False)
+        dividends = data["Dividends"]
+        return dividends[dividends != 0]
+
+    def dividends_many(
+        self, tickers: list[str], refresh: bool = True
+    ) -> dict[str, pd.Series]:
+        """Like `dividends` for many tickers; tickers without data are left out."""
+        histories = self.histories(
+            tickers, period="max", auto_adjust=False, refresh=refresh
+        )
+        return {
+            ticker: data["Dividends"][data["Dividends"] != 0]
+            for ticker, data in histories.items()
+        }
+
+
+def _next_ex_date(dividends: pd.Series) -> pd.Timestamp | None:
+    """Expected next ex-dividend date from the spacing of the recent payments."""
+    if len(dividends) < 2:
+        return None
+    spacing = dividends.index[-5:].to_series().diff().median()
+    return dividends.index[-1] + spacing
+
+
+class DividendCache:
+    def __init__(
+        self,
+        store: PriceStore | None = None,
+        path: str | Path = DIVIDEND_CACHE_PATH,
+        ttl: datetime.timedelta = datetime.timedelta(days=7),
+    ) -> None:
+        """
+        Per-ticker dividend cache on top of a `PriceStore`.
+
+        Each ticker is cached in its own entry together with the date it was
+        fetched. An entry expires after `ttl` or once the next ex-dividend date
+        (estimated from the payment history) has passed since the fetch, and
+        only expired tickers are refetched.
+
+        Args:
+            store (PriceStore | None): Store used to fetch expired tickers
+                (default: the shared store of this module).
+            path (str | Path): Directory of the cache entries.
+            ttl (datetime.timedelta): Maximum age of an entry.
+        """
+        self.store = store or _default_store
+        self.path = Path(path)
+        self.ttl = ttl
+
+    def _entry_path(self, ticker: str) -> Path:
+        return self.path / f"{ticker}.joblib"
+
+    def _load(self, ticker: str) -> dict | None:
+        file = self._entry_path(ticker)
+        return joblib.load(file) if file.exists() else None
+
+    def is_expired(self, entry: dict | None, today: datetime.date) -> bool:
+        if entry is None or today - entry["fetched_at"] > self.ttl:
+            return True
+        next_ex_date = _next_ex_date(entry["dividends"])
+        return next_ex_date is not None and (
+            entry["fetched_at"] < next_ex_date.date() <= today
+        )
+
+    def get(self, tickers: list[str], force: bool = False) -> dict[str, pd.Series]:
+        """
+        Dividend history per ticker, refetching only expired entries.
+
+        Expired tickers are refreshed in the price store (redownloaded even if
+        the store considers them fresh only with `force`). A ticker whose
+        download fails keeps its previous entry; without one, the dividends of
+        its local history are returned but not cached, so the next call tries
+        again.
+        """
+        today = datetime.date.today()
+        entries = {ticker: self._load(ticker) for ticker in dict.fromkeys(tickers)}
+        expired = [t for t, e in entries.items() if force or self.is_expired(e, today)]
+
+        if expired:
+            log.info(f"Refetching dividends for {len(expired)} ticker(s)")
+            self.store.refresh(expired, force=force)
+            self.path.mkdir(parents=True, exist_ok=True)
+            local = self.store.dividends_many(expired, refresh=False)
+            for ticker, dividends in local.items():
+                entry = {"fetched_at": today, "dividends": dividends}
+                if not self.store.is_stale(ticker):
+                    entries[ticker] = entry
+                    joblib.dump(entry, self._entry_path(ticker))
+                elif entries[ticker] is None:
+                    log.warning(f"Using the stored dividends of {ticker}")
+                    entries[ticker] = entry
+
+        return {t: e["dividends"] for t, e in entries.items() if e is not None}
+
+
+_default_store = PriceStore()
+
+
+def get_history(
+    ticker: str, period: str = "max", auto_adjust: bool = True
+) -> pd.DataFrame:
+    return _default_store.history(ticker, period=period, auto_adjust=auto_adjust)
+
+
+def get_histories(
+    tickers: list[str], period: str = "max", auto_adjust: bool = True
+) -> dict[str, pd.DataFrame]:
+    return _default_store.histories(tickers, period=period, auto_adjust=auto_adjust)
+
+
+def scan_prices(
+    tickers: list[str], period: str = "max", auto_adjust: bool = True
+) -> "pl.LazyFrame":
+    return _default_store.scan(tickers, period=period, auto_adjust=auto_adjust)
+
+
+def get_dividends(ticker: str) -> pd.Series:
+    return _default_store.dividends(ticker)
+
+
+def get_dividends_many(tickers: list[str]) -> dict[str, pd.Series]:
+    return _default_store.dividends_many(tickers)
+
+
+def refresh(tickers: list[str], force: bool = False) -> list[str]:
+    return _default_store.refresh(tickers, force=force)
@@ -0,0 +1,149 @@
+"""
+Exchange rates from the local price store.
+
+The daily rate of every currency against USD is stored like any other ticker
+(`EURUSD=X`, `CHFUSD=X`, ...), so each pair and day is downloaded only once
+and reports are served from local disk. Amounts are converted column-wise,
+either at the latest rate or at the rate of their own date (as-of join, for
+historical cashflows like past dividends).
+"""
+
+import datetime
+from typing import Iterable
+
+import polars as pl
+
+from utils.data import scan_prices
+from utils.log import log
+
+BASE = "USD"
+
+# listing currency by Yahoo ticker suffix, everything else is quoted in USD
+SUFFIX_CURRENCIES = {
+    ".AS": "EUR",
+    ".BR": "EUR",
+    ".DE": "EUR",
+    ".F": "EUR",
+    ".MC": "EUR",
+    ".MI": "EUR",
+    ".PA": "EUR",
+    ".VI": "EUR",
+    ".SW": "CHF",
+    ".TO": "CAD",
+}
+
+_SCHEMA = {"date": pl.Date, "currency": pl.String, "rate": pl.Float64}
+
+
+def currency_of(ticker: str) -> str:
+    """Listing currency of a Yahoo ticker, from its exchange suffix."""
+    _, dot, suffix = ticker.rpartition(".")
+    return SUFFIX_CURRENCIES.get(f".{suffix}", BASE) if dot else BASE
+
+
+def with_currency(frame: pl.DataFrame, ticker: str = "ticker") -> pl.DataFrame:
+    """Adds the listing currency of the tickers in column `ticker` as `currency`."""
+    tickers = frame[ticker].unique(maintain_order=True).to_list()
+    currencies = pl.DataFrame(
+        {ticker: tickers, "currency": [currency_of(t) for t in tickers]},
+        schema={ticker: frame.schema[ticker], "currency": pl.String},
+    )
+    return frame.join(currencies, on=ticker, how="left", maintain_order="left")
+
+
+def rates(currencies: Iterable[str], period: str = "max") -> pl.DataFrame:
+    """
+    Daily closing rates of `currencies` in USD, refreshing stale pairs first.
+
+    Returns:
+        pl.DataFrame: `date`, `currency` and `rate` (USD per unit), sorted by
+            currency and date. USD itself has a constant rate of 1.
+    """
+    frames = [
+        pl.DataFrame(
+            {"date": [datetime.date(1900, 1, 1)], "currency": [BASE], "rate": [1.0]},
+            schema=_SCHEMA,
+        )
+    ]
+
+    foreign = sorted(set(currencies) - {BASE})
+    if foreign:
+        pairs = [f"{c}{BASE}=X" for c in foreign]
+        prices = scan_prices(pairs, period=period, auto_adjust=False)
+        frames.append(
+            prices.select(
+                "date",
+                pl.col("ticker").cast(pl.String).str.head(3).alias("currency"),
+                pl.col("close").cast(pl.Float64).alias("rate"),
+            ).collect()
+        )
+
+    return pl.concat(frames).sort("currency", "date")
+
+
+def latest_rates(rates: pl.DataFrame) -> dict[str, float]:
+    """Most recent rate per currency."""
+    latest = rates.group_by("currency").agg(pl.col("rate").sort_by("date").last())
+    return dict(latest.iter_rows())
+
+
+def convert(
+    frame: pl.DataFrame,
+    columns: list[str],
+    rates: pl.DataFrame,
+    currency: str = "currency",
+    date: str | None = None,
+) -> pl.DataFrame:
+    """
+    Converts the amounts in `columns` into USD, in place of the originals.
+
+    Args:
+        frame (pl.DataFrame): Amounts with their currency.
+        columns (list[str]): Columns to convert.
+        rates (pl.DataFrame): Output of `rates`, covering all currencies.
+        currency (str): Column with the currency of each row.
+        date (str | None): Column with the date of each row, converted at the
+            last rate on or before it (or the first rate for earlier dates).
+            The latest rate is used if None.
+
+    Returns:
+        pl.DataFrame: `frame` (same row order) with converted `columns`.
+    """
+    rate = rates.rename(
+        {"date": "_rate_date", "currency": currency, "rate": "_rate"}
+    ).sort("_rate_date")
+    if date is None:
+        latest = rate.group_by(currency).agg(
+            pl.col("_rate").sort_by("_rate_date").last()
+        )
+        joined = frame.join(latest, on=currency, how="left", maintain_order="left")
+    else:
+        joined = (
+            frame.with_row_index("_row")
+            .with_columns(pl.col(date).cast(pl.Date).alias("_date"))
+            .sort("_date")
+            .join_asof(
+                rate,
+                left_on="_date",
+                right_on="_rate_date",
+                by=currency,
+                check_sortedness=False,  # both sides are sorted above
+            )
+            .sort("_row")
+            .drop("_row", "_date", "_rate_date", strict=False)
+        )
+        # dates before the first stored rate use the first one
+        first = rate.group_by(currency).agg(pl.col("_rate").first().alias("_first"))
+        joined = (
+            joined.join(first, on=currency, how="left", maintain_order="left")
+            .with_columns(pl.col("_rate").fill_null(pl.col("_first")))
+            .drop("_first")
+        )
+
+    missing = joined.filter(pl.col("_rate").is_null())[currency].unique()
+    if len(missing) > 0:
+        log.warning(f"No exchange rate for {', '.join(missing.to_list())}")
+
+    return joined.with_columns(pl.col(c) * pl.col("_rate") for c in columns).drop(
+        "_rate"
+    )
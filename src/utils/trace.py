@@ -0,0 +1,285 @@
+"""
+Lightweight timing of pipeline stages.
+
+Code marks its stages with `span`, which nest, and can `count` things like
+fetched rows and bytes within them. Nothing is recorded until `start` is
+called (`pft --trace out/trace.json ...`), so the spans cost next to nothing
+otherwise. A finished trace is written in the Chrome trace event format (open
+it in `chrome://tracing` or https://ui.perfetto.dev) and summarized as a table
+of the time, memory and counters per stage.
+
+    from utils import trace
+
+    with trace.span("download", ticker=ticker):
+        data = download(ticker)
+        trace.count("rows_fetched", len(data))
+
+Spans started on another thread only nest under the current span if the
+thread runs the function wrapped by `with_context`.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class Span:
+    """A timed stage; `path` joins the names of all enclosing spans with "/"."""
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict) -> None:
+        self.name = name
+        self.parent = parent
+        self.path = name if parent is None else f"{parent.path}/{name}"
+        self.attrs = attrs
+        self.thread = threading.current_thread()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.counters: dict[str, float] = {}
+        self.peak_memory: int | None = None
+        self._start_memory = 0
+        self._peak = 0
+
+
+class Tracer:
+    def __init__(self, memory: bool = False) -> None:
+        """
+        Collects the spans of one run.
+
+        Args:
+            memory (bool): Record the peak of the memory allocated while each
+                span is open (via `tracemalloc`, which slows down allocation
+                heavy code). Memory is tracked per process, so spans running
+                concurrently on other threads add to each other's peaks.
+        """
+        self.memory = memory
+        self.origin = time.perf_counter()
+        self.spans: list[Span] = []
+        self.counters: dict[str, float] = {}
+        self._open: set[Span] = set()
+        self._lock = threading.Lock()
+
+    def _fold_peak(self) -> None:
+        """Credits the peak since the last reset to every open span."""
+        _, peak = tracemalloc.get_traced_memory()
+        for span in self._open:
+            span._peak = max(span._peak, peak)
+        tracemalloc.reset_peak()
+
+    def enter(self, span: Span) -> None:
+        if not self.memory:
+            return
+        with self._lock:
+            self._fold_peak()
+            span._start_memory = span._peak = tracemalloc.get_traced_memory()[0]
+            self._open.add(span)
+
+    def exit(self, span: Span) -> None:
+        span.duration = time.perf_counter() - span.start
+        with self._lock:
+            if self.memory:
+                self._fold_peak()
+                self._open.discard(span)
+                span.peak_memory = span._peak - span._start_memory
+            if span.parent is not None:
+                for name, value in span.counters.items():
+                    span.parent.counters[name] = (
+                        span.parent.counters.get(name, 0) + value
+                    )
+            self.spans.append(span)
+
+    def count(self, span: Span | None, name: str, value: float) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if span is not None:
+                span.counters[name] = span.counters.get(name, 0) + value
+
+    def chrome_trace(self) -> dict:
+        """The spans as complete ("X") events of the Chrome trace event format."""
+        pid = os.getpid()
+        threads = {s.thread.ident: s.thread.name for s in self.spans}
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in threads.items()
+        ]
+        for s in sorted(self.spans, key=lambda s: s.start):
+            args = {**s.attrs, **s.counters}
+            if s.peak_memory is not None:
+                args["peak_memory"] = s.peak_memory
+            events.append(
+                {
+                    "name": s.name,
+                    "cat": s.path,
+                    "ph": "X",
+                    "ts": (s.start - self.origin) * 1e6,
+                    "dur": s.duration * 1e6,
+                    "pid": pid,
+                    "tid": s.thread.ident,
+                    "args": {
+                        k: v if isinstance(v, (int, float)) else str(v)
+                        for k, v in args.items()
+                    },
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str | Path) -> None:
+        """Writes the trace as Chrome trace JSON."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.chrome_trace()))
+
+    def summary(self) -> list[dict]:
+        """
+        Totals per span path, in the order the stages first started (children
+        below their parent).
+
+        Returns:
+            list[dict]: `path`, `calls`, `seconds`, `peak_memory` (max over the
+                calls, None without memory tracking) and `counters`.
+        """
+        rows: dict[str, dict] = {}
+        for s in sorted(self.spans, key=lambda s: s.start):
+            row = rows.setdefault(
+                s.path,
+                {
+                    "path": s.path,
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "peak_memory": None,
+                    "counters": {},
+                    "first_start": s.start,
+                },
+            )
+            row["calls"] += 1
+            row["seconds"] += s.duration
+            if s.peak_memory is not None:
+                row["peak_memory"] = max(row["peak_memory"] or 0, s.peak_memory)
+            for name, value in s.counters.items():
+                row["counters"][name] = row["counters"].get(name, 0) + value
+
+        def tree_order(row: dict) -> tuple:
+            parts = row["path"].split("/")
+            prefixes = ("/".join(parts[: i + 1]) for i in range(len(parts)))
+            return tuple(rows[p]["first_start"] if p in rows else 0 for p in prefixes)
+
+        ordered = sorted(rows.values(), key=tree_order)
+        for row in ordered:
+            del row["first_start"]
+        return ordered
+
+    def print_summary(self) -> None:
+        """Prints `summary` as a rich table."""
+        from rich.console import Console
+        from rich.table import Table
+
+        rows = self.summary()
+        counters = list(dict.fromkeys(c for r in rows for c in r["counters"]))
+
+        table = Table(title="Trace summary")
+        table.add_column("Stage")
+        table.add_column("Calls", justify="right")
+        table.add_column("Time [s]", justify="right")
+        if self.memory:
+            table.add_column("Peak memory [MB]", justify="right")
+        for name in counters:
+            table.add_column(name, justify="right")
+
+        for row in rows:
+            depth = row["path"].count("/")
+            cells = [
+                "  " * depth + row["path"].rsplit("/", 1)[-1],
+                str(row["calls"]),
+                f"{row['seconds']:.3f}",
+            ]
+            if self.memory:
+                peak = row["peak_memory"]
+                cells.append("" if peak is None else f"{peak / 2**20:.1f}")
+            cells += [
+                f"{row['counters'][name]:,.0f}" if name in row["counters"] else ""
+                for name in counters
+            ]
+            table.add_row(*cells)
+
+        Console().print(table)
+
+
+_tracer: Tracer | None = None
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "span", default=None
+)
+
+
+def start(memory: bool = False) -> Tracer:
+    """Starts recording spans (see `Tracer`)."""
+    global _tracer
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _tracer = Tracer(memory=memory)
+    return _tracer
+
+
+def stop() -> Tracer | None:
+    """Stops recording and returns the tracer with the finished spans."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None and tracer.memory:
+        tracemalloc.stop()
+    return tracer
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span | None]:
+    """
+    Times the enclosed block as a stage named `name`. Keyword arguments are
+    stored with the span. Also usable as a decorator.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield None
+        return
+
+    s = Span(name, _current.get(), attrs)
+    token = _current.set(s)
+    tracer.enter(s)
+    try:
+        yield s
+    finally:
+        tracer.exit(s)
+        _current.reset(token)
+
+
+def count(name: str, value: float = 1) -> None:
+    """Adds `value` to the counter `name` of the current span (and its parents)."""
+    tracer = _tracer
+    if tracer is not None:
+        tracer.count(_current.get(), name, value)
+
+
+def with_context(func: Callable[..., T]) -> Callable[..., T]:
+    """
+    Wraps `func` to run in the current context, so spans it opens on a worker
+    thread nest under the span that was open when it was wrapped.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs) -> T:
+        # a context can only be entered by one thread at a time
+        return context.copy().run(func, *args, **kwargs)
+
+    return run